@@ -2,13 +2,15 @@ import os
 import sys
 from pathlib import Path
 import flet as ft
-import json
 import yaml
 import zipfile
 import tempfile
 import shutil
 from PIL import Image
+# Helpers shared with the build scripts, PixelMiner.spec adds the same folder for frozen builds
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
 from pack_import import PackImporter
+from mapping_store import get_mapping_store
 import argparse
 import subprocess
 import glob
@@ -220,11 +222,11 @@ def main(page: ft.Page):
         pack['config'][key] = e.control.value
        
     def load_source_mapping(source_mapping_file, source_dir):
-        with open(source_mapping_file, 'r') as file:
-            source_mapping = json.load(file)
+        # The store keeps the parsed file until it changes, so the entries are copied before their paths are joined
+        source_mapping = get_mapping_store(source_mapping_file, 'Version_Mappings').source_mapping()
         items = []
         for key, item in source_mapping.items():
-            item['path'] = os.path.join(source_dir, item.get('path', ''))
+            item = {**item, 'path': os.path.join(source_dir, item.get('path', ''))}
             items.append((key, item))
         # Sort the list of tuples by the 'path' key in the item
         sorted_items = sorted(items, key=lambda x: x[1]['path'])
@@ -550,8 +552,7 @@ def main(page: ft.Page):
                         config_data = yaml.safe_load(file)
                 source_mapping_file = build_data.get("source_mapping_file", None)
                 if source_mapping_file:
-                    with open(source_mapping_file, 'r') as file:
-                        source_mapping = json.load(file)
+                    source_mapping = get_mapping_store(source_mapping_file, 'Version_Mappings').source_mapping()
                     source_dir = build_data.get("source_dir", None)
                     pack_icon = source_mapping.get("TEXTURE_PACK", {}).get("path", "missing.png")
                     pack_icon_path = os.path.join(source_dir, pack_icon)
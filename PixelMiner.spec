@@ -3,7 +3,7 @@
 
 a = Analysis(
     ['PixelMiner.py'],
-    pathex=[],
+    pathex=['scripts'],
     binaries=[],
     datas=[('scripts', 'scripts'), ('assets', 'assets'), ('Version_Mappings', 'Version_Mappings')],
     hiddenimports=[],
@@ -1,2 +1,2 @@
-pyinstaller --noconfirm --onefile --icon="assets/PixelMiner.ico" --console --add-data "scripts;scripts" --add-data "assets;assets" --add-data "Version_Mappings;Version_Mappings" PixelMiner.py
+pyinstaller --noconfirm --onefile --icon="assets/PixelMiner.ico" --console --paths "scripts" --add-data "scripts;scripts" --add-data "assets;assets" --add-data "Version_Mappings;Version_Mappings" PixelMiner.py
 pause
\ No newline at end of file
@@ -4,9 +4,14 @@ import shutil
 import zipfile
 import json
 import yaml
-import re
 import tempfile
-from PIL import Image, ImageOps
+from PIL import Image
+
+# Helpers shared with the build scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from image_index import image_index
+from mapping_store import get_mapping_store
+from stamp_transform import stamp_transform, apply_transpose
 
 class PackImporter:
     def __init__(self, new_pack_name, pack_import_path, template_source_mapping, template_pack_config, template_build_config):
@@ -64,54 +69,6 @@ class PackImporter:
             print(f"pack_format not found")
             return
 
-    #Load all mapping files for a specific version
-    def _load_mappings(self, platform, version, mappings_dir):
-        mappings = []
-        version_dir = os.path.join(mappings_dir, platform, version)
-        print(f"Loading mappings from: {version_dir}")
-        if not os.path.exists(version_dir):
-            print(f"No mappings found for version {version}")
-            return mappings
-        #print(f"Files in the directory: {os.listdir(version_dir)}")
-        for category_file in os.listdir(version_dir):
-            if category_file.endswith('.json'):
-                with open(os.path.join(version_dir, category_file), 'r') as file:
-                    category_mappings = json.load(file)
-                    mappings.extend(category_mappings)
-                    print(f"Loaded {len(category_mappings)} mappings from {category_file}")
-            else:
-                print(f"Ignoring non-JSON file: {category_file}")
-        return mappings
-
-    #Load the UID to file path mappings
-    def _load_uid_mappings(self, uid_mapping_file, current_version):
-        """Load the UID to file path mappings with version handling, including inheritance from previous versions."""
-        with open(uid_mapping_file, 'r') as file:
-            all_uid_mappings = json.load(file)
-            uid_mappings = {}
-
-            def parse_version(version_str):
-                return tuple(map(int, version_str.split('.')))
-
-            current_version_tuple = parse_version(current_version)
-
-            for uid, data in all_uid_mappings.items():
-                version_specific_data = data.get("versions", {})
-                merged_data = data.copy()  # Start with default data
-
-                if version_specific_data:
-                    # Sort versions in ascending order
-                    sorted_versions = sorted(version_specific_data.keys(), key=parse_version)
-
-                    # Iterate through sorted versions and apply overrides
-                    for version in sorted_versions:
-                        if current_version_tuple <= parse_version(version):
-                            merged_data.update(version_specific_data[version])  # Apply version-specific overrides
-
-                uid_mappings[uid] = merged_data
-
-        return uid_mappings
-
     def deconstruct_atlas(self, source_dir, atlas_path, mapping, uid_mappings, atlas_type, grid_size=None, canvas_size=None, scale_factor=None):
         with Image.open(atlas_path) as atlas:
             if atlas_type == 'grid':
@@ -154,6 +111,9 @@ class PackImporter:
                     paste_area = tuple(item.get('copy', (0, 0, atlas.width, atlas.height)))
                     copy_width = paste_area[2] - paste_area[0]
                     copy_height = paste_area[3] - paste_area[1]
+                    if item.get('rotate', 0) % 180 == 90:
+                        # A quarter turn swaps the sides of the stamp in the atlas
+                        copy_width, copy_height = copy_height, copy_width
                     if scale_factor:
                         copy_area = (
                             int(copy_area[0] * scale_factor[0]),
@@ -163,24 +123,8 @@ class PackImporter:
                         )
                     cropped_img = atlas.crop(copy_area)
 
-                    rotate_angle = item.get('rotate', 0)
-                    
-                    if abs(rotate_angle) == 90:
-                        x, y = cropped_img.size
-                        if x > y:
-                            cropped_img = cropped_img.resize((x, x))
-                        else:
-                            cropped_img = cropped_img.resize((y, y))
-                        rotated_img = cropped_img.rotate(rotate_angle)
-                        rotated_img = rotated_img.resize((y,x))
-                    else:
-                        rotated_img = cropped_img.rotate(rotate_angle)
-
-                    flip_direction = item.get('flip')
-                    if flip_direction == "Horizontal":
-                        rotated_img = ImageOps.mirror(rotated_img)
-                    elif flip_direction == "Vertical":
-                        rotated_img = ImageOps.flip(rotated_img)
+                    # Undo the stamp's rotate and flip with one lossless transpose
+                    rotated_img = apply_transpose(cropped_img, stamp_transform(item, inverse=True))
 
                     # Calculate scaled position and paste into the canvas
                     paste_loc = tuple(item.get('copy', (0, 0, atlas.width, atlas.height)))
@@ -203,9 +147,9 @@ class PackImporter:
         #print("Atlas deconstruction completed.")
 
     def calculate_scale_factor_for_atlas(self, atlas_path, mapping, uid_mappings, atlas_type, grid_size=None, canvas_size=None):
-        # Load the actual atlas image to get its size
-        with Image.open(atlas_path) as atlas_img:
-            actual_width, actual_height = atlas_img.size
+        # Read the actual atlas size from its header, the pixels are decoded once by deconstruct_atlas
+        atlas_info = image_index.get(atlas_path)
+        actual_width, actual_height = atlas_info.width, atlas_info.height
 
         # Calculate expected atlas size
         if atlas_type == 'grid':
@@ -474,10 +418,12 @@ class PackImporter:
         pack_format_to_version = self._load_pack_format_to_version(self.pack_format_to_version_file)
 
         platform, pack_version = self._read_pack_version(pack_import_path, pack_format_to_version)
-        source_mappings = self._load_uid_mappings(self.template_source_mapping, pack_version)
         
         if pack_version:
-            mappings = self._load_mappings(platform, pack_version, self.mappings_dir)
+            mapping_store = get_mapping_store(self.template_source_mapping, self.mappings_dir)
+            source_mappings = mapping_store.uid_mappings(platform, pack_version)
+            mappings = mapping_store.mappings(platform, pack_version)
+            print(f"Loaded {len(mappings)} mappings for {platform} {pack_version}")
             if mappings:
                 self._create_new_config_files(self.new_pack_name, self.template_source_mapping, self.template_pack_config, self.template_build_config, self.source_dir, pack_import_path)
                 self._import_resource_pack(pack_import_path, self.source_dir, mappings, source_mappings)
@@ -1,46 +1,115 @@
-import os
-from PIL import Image, ImageOps, ImageChops
+from PIL import Image, ImageChops
+import numpy as np
+from stamp_transform import stamp_transform, apply_transpose, apply_transpose_array
+from compositing import crop_array, paste_over, add_alpha
+from image_cache import decode_array
+from memory_budget import get_memory_budget, atlas_footprint
 from statistics import median
 import logging
 
+ATLAS_BACKENDS = ('pillow', 'numpy')
+
+def reduce_colors(uids, uid_mappings):
+    """An atlas is color reduced unless one of its UIDs opts out with "reduce_colors": "FALSE"."""
+    return all(uid_mappings.get(uid, {}).get('reduce_colors') != "FALSE" for uid in uids)
+
 class AtlasHandler:
-                           
-    def compile_atlas(self, source_dir, atlas_mappings, output_path, atlas_type, uid_mappings, grid_size=None, canvas_size=None):
+
+    def __init__(self, image_cache=None, backend='pillow'):
+        # Decoded source images shared with the other atlases of the build target
+        self.image_cache = image_cache
+        # Stamp and TGA atlases are composited with Pillow images or on a NumPy canvas, with identical output
+        if backend not in ATLAS_BACKENDS:
+            raise ValueError(f"Unknown atlas backend '{backend}'")
+        self.backend = backend
+
+    def open_source_image(self, source_tree, img_path, cached=True):
+        """Return a decoded source image, from the image cache when there is one. The image must not be modified."""
+        if self.image_cache and cached:
+            return self.image_cache.open(source_tree, img_path)
+        img = source_tree.open_image(img_path)
+        img.load()
+        return img
+
+    def open_source_array(self, source_tree, img_path, cached=True):
+        """Return a decoded source image as a read only RGBA array and its crop padding, from the image cache when there is one."""
+        if self.image_cache and cached:
+            return self.image_cache.open_array(source_tree, img_path)
+        return decode_array(source_tree, img_path)
+
+    def composite_stamps(self, source_tree, atlas_mappings, uid_mappings, canvas, scale_factor, output_path, cached=True):
+        """Stamp every mapping onto a preallocated H x W x 4 canvas in place, the NumPy backend of compile_atlas.
+
+        Stamps are cropped and transposed as array views, blended with a vectorized alpha-over and alpha channels
+        are accumulated with lookup tables. Returns the alpha channel built from use_for_alpha and alpha_add stamps,
+        or None if there are none.
+        """
+        scale_x, scale_y = scale_factor
+        alpha_channel = None
+
+        for mapping in atlas_mappings:
+            uid = mapping['uid']
+            uid_info = uid_mappings.get(uid, {})
+            img_path = uid_info.get("path", "")
+
+            if not source_tree.exists(img_path):
+                logging.info(f"Error: Missing image file for UID '{uid}' in atlas '{output_path}'.")
+                continue
+
+            source, padding = self.open_source_array(source_tree, img_path, cached)
+            copy_area = (0, 0, source.shape[1], source.shape[0])
+            if mapping.get('copy'):
+                copy_area = tuple(mapping['copy'])
+                copy_area = (int(copy_area[0]) * scale_x, int(copy_area[1]) * scale_y, int(copy_area[2]) * scale_x, int(copy_area[3]) * scale_y)
+            stamp = apply_transpose_array(crop_array(source, copy_area, padding), stamp_transform(mapping))
+
+            position = tuple(mapping.get('position', (0, 0)))
+            scaled_pos = (int(position[0] * scale_x), int(position[1] * scale_y))
+
+            if mapping.get("use_for_alpha", False):
+                alpha_channel = np.array(stamp[..., 3])
+            elif "alpha_add" in mapping:
+                alpha_channel = add_alpha(alpha_channel, stamp[..., 3], mapping["alpha_add"])
+            else:
+                paste_over(canvas, stamp, scaled_pos)
+
+        return alpha_channel
+
+    def compile_atlas(self, source_tree, atlas_mappings, output_tree, output_path, atlas_type, uid_mappings, grid_size=None, canvas_size=None):
         if atlas_type == 'grid':
-            # Calculate the total size of the grid based on the largest image in each dimension
+            # Phase one: size the grid from the headers, based on the largest image in each dimension
             max_width = max_height = 0
-            image_data = []  # Store images and their positions
+            tiles = []  # Store the paths of the images and their dimensions
 
-            # Load images, calculate the total canvas size, and store them
             for uid in atlas_mappings:
                 uid_info = uid_mappings.get(uid, {})
-                img_path = os.path.join(source_dir, uid_info.get("path", ""))
+                img_path = uid_info.get("path", "")
 
                 logging.info(f"Attempting to open {uid} image at path: {img_path}")
 
-                if os.path.exists(img_path):
-                    with Image.open(img_path) as img:
-                        image_data.append((img.copy(), img.width, img.height))  # Copy the image and store its dimensions
-                        max_width = max(max_width, img.width)
-                        max_height = max(max_height, img.height)
+                if source_tree.exists(img_path):
+                    img_info = source_tree.image_info(img_path)
+                    tiles.append((img_path, img_info.width, img_info.height))
+                    max_width = max(max_width, img_info.width)
+                    max_height = max(max_height, img_info.height)
 
             # Ensure the canvas size is based on the grid
             canvas_size = (grid_size[0] * max_width, grid_size[1] * max_height)
-            atlas = Image.new('RGBA', canvas_size, (0, 0, 0, 0))
 
-            # Place images in the grid
-            x_offset = y_offset = 0
-            for i, (img, width, height) in enumerate(image_data):
-                atlas.paste(img, (x_offset, y_offset))
-                x_offset += width
-                if (i + 1) % grid_size[0] == 0:  # Move to next row after reaching the grid's end
-                    x_offset = 0
-                    y_offset += height
-
-            # Ensure the destination directory exists before saving the file
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-            atlas.save(output_path)
+            # Phase two: stream the tiles in, each is decoded, pasted and released before the next one is opened,
+            # so at most the canvas and one tile are held in memory
+            with get_memory_budget().reserve(atlas_footprint(canvas_size, max_width * max_height), output_path):
+                atlas = Image.new('RGBA', canvas_size, (0, 0, 0, 0))
+                x_offset = y_offset = 0
+                for i, (img_path, width, height) in enumerate(tiles):
+                    with source_tree.open_image(img_path) as img:
+                        atlas.paste(img, (x_offset, y_offset))
+                    x_offset += width
+                    if (i + 1) % grid_size[0] == 0:  # Move to next row after reaching the grid's end
+                        x_offset = 0
+                        y_offset += height
+
+                output_tree.save_image(output_path, atlas, reduce_colors(atlas_mappings, uid_mappings))
 
         elif atlas_type in ['stamp', 'tga']:
             # Initialize variables to check uniformity of scale factors
@@ -50,16 +119,17 @@ class AtlasHandler:
             for mapping in atlas_mappings:
                 uid = mapping['uid']
                 uid_info = uid_mappings.get(uid, {})
-                img_path = os.path.join(source_dir, uid_info.get("path", ""))
+                img_path = uid_info.get("path", "")
                 specified_resolution = uid_info.get("resolution", None)
 
                 logging.info(f"Attempting to open {uid} image at path: {img_path}")
 
-                if os.path.exists(img_path) and specified_resolution:
-                    with Image.open(img_path) as img:
-                        actual_resolution = (img.width, img.height)
-                        scale_factor = (actual_resolution[0] / specified_resolution[0], actual_resolution[1] / specified_resolution[1])
-                        scale_factors_info.append((scale_factor, img_path, specified_resolution, actual_resolution))
+                if source_tree.exists(img_path) and specified_resolution:
+                    # Only the header is needed to work out the scale factor
+                    img_info = source_tree.image_info(img_path)
+                    actual_resolution = (img_info.width, img_info.height)
+                    scale_factor = (actual_resolution[0] / specified_resolution[0], actual_resolution[1] / specified_resolution[1])
+                    scale_factors_info.append((scale_factor, img_path, specified_resolution, actual_resolution))
 
             # Calculate the median scale factor for each axis
             median_scale_factor_x = median([sf[0] for sf, _, _, _ in scale_factors_info])
@@ -68,86 +138,86 @@ class AtlasHandler:
             # Create an empty atlas with the specified canvas size, scaled
             scaled_canvas_size = (int(canvas_size[0] * median_scale_factor_x), int(canvas_size[1] * median_scale_factor_y))
             
-            if atlas_type == 'tga':
-                atlas = Image.new('RGBA', scaled_canvas_size, (1, 1, 1, 1))
-            else:
-                atlas = Image.new('RGBA', scaled_canvas_size, (0, 0, 0, 0))
+            # Reserve the canvas and the largest source from the headers, an atlas larger than the memory budget runs
+            # alone and decodes its sources one at a time instead of keeping them in the image cache
+            memory_budget = get_memory_budget()
+            footprint = atlas_footprint(scaled_canvas_size, max((width * height for _, _, _, (width, height) in scale_factors_info), default=0))
+            cached = memory_budget.fits(footprint)
+            if not cached:
+                memory_budget.note_oversized(output_path)
+
+            with memory_budget.reserve(footprint, output_path):
+                if self.backend == 'numpy':
+                    # One preallocated canvas, converted to an image once when the atlas is saved
+                    canvas = np.empty((scaled_canvas_size[1], scaled_canvas_size[0], 4), np.uint8)
+                    canvas[:] = (1, 1, 1, 1) if atlas_type == 'tga' else (0, 0, 0, 0)
+                    alpha_channel = self.composite_stamps(source_tree, atlas_mappings, uid_mappings, canvas, (median_scale_factor_x, median_scale_factor_y), output_path, cached)
+                    if alpha_channel is not None:
+                        canvas[..., 3] = alpha_channel
+                    atlas = Image.fromarray(canvas, 'RGBA')
+                else:
+                    if atlas_type == 'tga':
+                        atlas = Image.new('RGBA', scaled_canvas_size, (1, 1, 1, 1))
+                    else:
+                        atlas = Image.new('RGBA', scaled_canvas_size, (0, 0, 0, 0))
 
-            # Initialize a variable to store the alpha channel
-            alpha_channel = None
+                    # Initialize a variable to store the alpha channel
+                    alpha_channel = None
             
-            # Process each mapping in the atlas
-            for mapping in atlas_mappings:
-                uid = mapping['uid']
-                uid_info = uid_mappings.get(uid, {})
-                img_path = os.path.join(source_dir, uid_info.get("path", ""))
-
-                if os.path.exists(img_path):
-                    with Image.open(img_path) as img:
-                        # Perform operations: Copy, Rotate, and Flip
-                        copy_area = tuple(mapping.get('copy', (0, 0, img.width, img.height)))
-                        if mapping.get('copy'):
-                            copy_area = (
-                                int(copy_area[0]) * median_scale_factor_x,
-                                int(copy_area[1]) * median_scale_factor_y, 
-                                int(copy_area[2]) * median_scale_factor_x, 
-                                int(copy_area[3]) * median_scale_factor_y
-                                )
-                        cropped_img = img.crop(copy_area)
-
-                        rotate_angle = mapping.get('rotate', 0)
-                        
-                        if abs(rotate_angle) == 90:
-                            x, y = cropped_img.size
-                            if x > y:
-                                cropped_img = cropped_img.resize((x, x))
-                            else:
-                                cropped_img = cropped_img.resize((y, y))
-                            rotated_img = cropped_img.rotate(-rotate_angle)
-                            rotated_img = rotated_img.resize((y,x))
-                        else:
-                            rotated_img = cropped_img.rotate(-rotate_angle)
-
-                        flip_direction = mapping.get('flip')
-                        if flip_direction == "Horizontal":
-                            rotated_img = ImageOps.mirror(rotated_img)
-                        if flip_direction == "Vertical":
-                            rotated_img = ImageOps.flip(rotated_img)
-
-                        # Calculate scaled position
-                        position = tuple(mapping.get('position', (0, 0)))
-                        scaled_pos = (int(position[0] * median_scale_factor_x), int(position[1] * median_scale_factor_y))
-
-                        if mapping.get("use_for_alpha", False):
-                            # Handle alpha channel separately
-                            alpha_channel = rotated_img.split()[3]
-                        elif "alpha_add" in mapping:
-                            # Add to the alpha channel with specified opacity
-                            alpha_addition = rotated_img.split()[3].point(lambda p: int(p * mapping["alpha_add"]))
-                            alpha_channel = ImageChops.add(alpha_channel, alpha_addition)
-                        else:
-                            # Convert to 'RGBA' only if not used for alpha channel
+                    # Process each mapping in the atlas
+                    for mapping in atlas_mappings:
+                        uid = mapping['uid']
+                        uid_info = uid_mappings.get(uid, {})
+                        img_path = uid_info.get("path", "")
+
+                        if source_tree.exists(img_path):
+                            img = self.open_source_image(source_tree, img_path, cached)
+                            # Perform operations: Copy, Rotate, and Flip
+                            copy_area = tuple(mapping.get('copy', (0, 0, img.width, img.height)))
+                            if mapping.get('copy'):
+                                copy_area = (
+                                    int(copy_area[0]) * median_scale_factor_x,
+                                    int(copy_area[1]) * median_scale_factor_y, 
+                                    int(copy_area[2]) * median_scale_factor_x, 
+                                    int(copy_area[3]) * median_scale_factor_y
+                                    )
+                            cropped_img = img.crop(copy_area)
+
+                            # Rotate and flip with one lossless transpose, so pixel art is never resampled
+                            rotated_img = apply_transpose(cropped_img, stamp_transform(mapping))
+
+                            # Calculate scaled position
+                            position = tuple(mapping.get('position', (0, 0)))
+                            scaled_pos = (int(position[0] * median_scale_factor_x), int(position[1] * median_scale_factor_y))
+
+                            # Sources may be palette or grayscale PNGs after color reduction
                             if rotated_img.mode != 'RGBA':
                                 rotated_img = rotated_img.convert('RGBA')
-                            atlas.paste(rotated_img, scaled_pos, rotated_img)
 
-                else:
-                    logging.info(f"Error: Missing image file for UID '{uid}' in atlas '{output_path}'.")
+                            if mapping.get("use_for_alpha", False):
+                                # Handle alpha channel separately
+                                alpha_channel = rotated_img.split()[3]
+                            elif "alpha_add" in mapping:
+                                # Add to the alpha channel with specified opacity
+                                alpha_addition = rotated_img.split()[3].point(lambda p: int(p * mapping["alpha_add"]))
+                                alpha_channel = ImageChops.add(alpha_channel, alpha_addition)
+                            else:
+                                atlas.paste(rotated_img, scaled_pos, rotated_img)
 
-            # Merge alpha channel if it's set
-            if alpha_channel:
-                atlas.putalpha(alpha_channel)
+                        else:
+                            logging.info(f"Error: Missing image file for UID '{uid}' in atlas '{output_path}'.")
 
-            # Ensure the destination directory exists before saving the file
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                    # Merge alpha channel if it's set
+                    if alpha_channel:
+                        atlas.putalpha(alpha_channel)
 
-            # Check if the output format should be TGA
-            if output_path.lower().endswith(".tga"):
-                # Save in TGA format
-                atlas.save(output_path, format="TGA")
-            else:
-                # Save in default format
-                atlas.save(output_path)
+                # Check if the output format should be TGA
+                if output_path.lower().endswith(".tga"):
+                    # Save in TGA format
+                    output_tree.save_image(output_path, atlas, format="TGA")
+                else:
+                    # Save in default format
+                    output_tree.save_image(output_path, atlas, reduce_colors([mapping['uid'] for mapping in atlas_mappings], uid_mappings))
         
         # Add an else clause for cases where atlas_type doesn't match any known types
         else:
@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+def atomic_write(path, data):
+    """Write bytes to path through a temp file in the same folder and os.replace, so readers, also those of
+    concurrent builds, never see a partial file. Raises OSError after removing the temp file if the write fails."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
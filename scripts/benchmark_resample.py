@@ -0,0 +1,79 @@
+import argparse
+import sys
+import time
+from build import load_yml_config, load_texture_array, scale_texture_stack, get_build_mapping_store, BATCH_MODES, BATCH_MAX_PIXELS
+from image_index import image_index
+from source_index import get_source_index
+import numpy as np
+
+# (resample filter, alpha mode) combinations compared, LANCZOS with SEPARATE alpha is what a default build does
+POLICIES = [
+    ('LANCZOS', 'SEPARATE'),
+    ('LANCZOS', 'CUTOUT'),
+    ('BOX', 'SEPARATE'),
+    ('NEAREST', 'SEPARATE'),
+]
+
+def load_mapping_textures(build_config):
+    """Decode every downsampled PNG of the source mapping the batched stage can stack, grouped by size and mode."""
+    source_index = get_source_index(build_config['source_dir'])
+    groups = {}
+    paths = set()
+    for uid, uid_info in get_build_mapping_store(build_config).source_mapping().items():
+        path = uid_info.get('path', '')
+        if path in paths or not path.lower().endswith('.png') or uid_info.get('downsample') == "FALSE" or uid_info.get('inject') == "TRUE":
+            continue
+        if not source_index.exists(path):
+            continue
+        img_info = image_index.get(source_index.path(path), source_index.stat(path))
+        if img_info.mode not in BATCH_MODES:
+            continue
+        paths.add(path)
+        groups.setdefault((img_info.width, img_info.height, img_info.mode), []).append(load_texture_array(source_index.path(path), img_info.mode))
+
+    stacks = []
+    for (width, height, mode), textures in groups.items():
+        chunk_size = max(1, BATCH_MAX_PIXELS // (width * height))
+        for start in range(0, len(textures), chunk_size):
+            stacks.append(np.stack(textures[start:start + chunk_size]))
+    return stacks
+
+def benchmark(stacks, scale_factors, resample_filter, alpha_mode, repeat):
+    """Best time of repeat runs downsampling every stack to every scale factor."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for stack in stacks:
+            # Only RGBA textures take an alpha mode, as in the build
+            stack_alpha_mode = alpha_mode if stack.shape[-1] == 4 else 'SEPARATE'
+            for scale_factor in scale_factors:
+                scale_texture_stack(stack, scale_factor, stack_alpha_mode, resample_filter)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(config_path, repeat=3):
+    build_config = load_yml_config(config_path)
+    pack_variables = load_yml_config(build_config['pack_config_file'])
+    scale_factors = sorted({0.5 ** int(scale_key) for scale_key in pack_variables['resolutions'] if int(scale_key) > 0}, reverse=True)
+
+    stacks = load_mapping_textures(build_config)
+    textures = sum(len(stack) for stack in stacks)
+    megapixels = sum(stack.shape[0] * stack.shape[1] * stack.shape[2] for stack in stacks) / 1e6
+    print(f"{textures} textures, {megapixels:.1f} MP, scale factors {scale_factors}, best of {repeat} runs")
+
+    baseline = None
+    for resample_filter, alpha_mode in POLICIES:
+        elapsed = benchmark(stacks, scale_factors, resample_filter, alpha_mode, repeat)
+        baseline = baseline or elapsed
+        print(f"{resample_filter:>8} {alpha_mode:<9} {elapsed:7.2f} s  {textures / elapsed:8.0f} textures/s  "
+              f"{megapixels / elapsed:7.1f} MP/s  {baseline / elapsed:5.1f}x")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare downsampling throughput of the resample filters on the textures of a source mapping')
+    parser.add_argument('config', help='Path to the build configuration file')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per policy, the fastest is reported')
+    args = parser.parse_args()
+
+    sys.exit(main(args.config, repeat=max(1, args.repeat)))
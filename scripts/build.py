@@ -1,14 +1,30 @@
 import argparse
 import os
+import sys
 import logging
+import logging.handlers
+import multiprocessing
+import concurrent.futures
+import tempfile
+import math
 import json
-from unittest import skip
 import yaml
 import shutil
-import zipfile
 from datetime import datetime
 from atlas import AtlasHandler
-from PIL import Image, ImageFilter
+from texture_cache import TextureCache
+from image_cache import DecodedImageCache
+from image_index import image_index
+from resample import bleed_alpha_nearest_batch, scale_textures_batch, scale_texture_tiled, scale_textures_premultiplied, scale_textures_box, scale_textures_nearest, box_factor
+from memory_budget import MemoryBudget, WorkerPeakMemory, get_memory_budget, set_memory_budget, set_worker_peak_memory, note_worker_peak, texture_footprint, report_peak_memory
+from pack_tree import DirectoryTree, MemoryTree
+from pack_zip import create_zip_from_tree, get_zip_options
+from png_encoder import PngEncoder, PNG_PROFILES
+from mapping_store import get_mapping_store, mapping_uids
+from source_index import get_source_index
+from source_dedup import ContentDedup
+from build_manifest import BuildManifest, hash_file, hash_builder_scripts, hash_source_tree
+from PIL import Image
 import numpy as np
 import cv2
 
@@ -45,88 +61,44 @@ def load_version_to_pack_format(file_path):
 def format_pack_version_number(version_list):
     return '.'.join(str(number) for number in version_list)
 
-def get_path(pack_dir, source):
+def get_path(source_index, source):
     path = source.get('path', '')
-    #print(f"File path: {os.path.join(pack_dir, path)}")
-    if not os.path.exists(os.path.join(pack_dir, path)):
+    #print(f"File path: {source_index.path(path)}")
+    if not source_index.exists(path):
         fallback = source.get('fallback', '')
         #print(f"File missing, checking fallback: {fallback}")
-        if os.path.exists(fallback):
-            shutil.copy(fallback, os.path.join(pack_dir, path))
+        if path and source_index.fallback_exists(fallback):
+            shutil.copy(fallback, source_index.path(path))
+            source_index.add(path)
 
     return path
 
-def load_uid_mappings(uid_mapping_file, current_version):
-    """Load the UID to file path mappings with version handling, including inheritance from previous versions."""
-    with open(uid_mapping_file, 'r') as file:
-        all_uid_mappings = json.load(file)
-        uid_mappings = {}
-
-        def parse_version(version_str):
-            return tuple(map(int, version_str.split('.')))
-
-        current_version_tuple = parse_version(current_version)
-
-        for uid, data in all_uid_mappings.items():
-            version_specific_data = data.get("versions", {})
-            merged_data = data.copy()  # Start with default data
-
-            if version_specific_data:
-                # Sort versions in ascending order
-                sorted_versions = sorted(version_specific_data.keys(), key=parse_version)
-
-                # Iterate through sorted versions and apply overrides
-                for version in sorted_versions:
-                    if current_version_tuple <= parse_version(version):
-                        merged_data.update(version_specific_data[version])  # Apply version-specific overrides
-
-            uid_mappings[uid] = merged_data
-
-    return uid_mappings
-
-def load_mappings(version, mappings_dir):
-    """ Load all mapping files for a specific version """
-    mappings = []
-    version_dir = os.path.join(mappings_dir, version)
-    logging.warning(f"Loading mappings from: {version_dir}")
-    if not os.path.exists(version_dir):
-        logging.warning(f"Warning: No mappings found for version {version}")
-        return mappings
-    logging.warning(f"Files in the directory: {os.listdir(version_dir)}")  # Debug print
-    for category_file in os.listdir(version_dir):
-        if category_file.endswith('.json'):
-            with open(os.path.join(version_dir, category_file), 'r') as file:
-                mappings.extend(json.load(file))
-        else:
-            logging.warning(f"Warning: Ignoring non-JSON file: {category_file}")
-    return mappings
-
-def replace_variables_in_file(file_path, variables):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-        for key, value in variables.items():
-            content = content.replace(f"%{key}%", str(value))
-    
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(content)
+def seed_fallbacks(source_index, mapping_store, targets):
+    """Copy the fallback files of the UIDs the targets use into the pack up front so parallel builds never race on
+    the copy. UIDs only used by platforms and versions that aren't built are left alone."""
+    for platform, version in sorted({(target['platform'], target['version']) for target, _ in targets}):
+        for uid_info in mapping_store.uid_mappings(platform, version).values():
+            if uid_info.get('fallback') and uid_info.get('path'):
+                get_path(source_index, uid_info)
 
-def find_resolution_specific_texture(source_dir, version_relative_path, target_height):
-    """Find if there is a resolution-specific texture available in the source directory."""
-    base, ext = os.path.splitext(version_relative_path)
-    logging.warning(f"target_height: {target_height}")
-    resolution_suffix = f"_{target_height}px{ext}"
-    logging.warning(f"resolution_suffix: {resolution_suffix}")
-    resolution_specific_path = os.path.join(source_dir, f"{base.replace('/', os.sep)}{resolution_suffix}")
+def replace_variables_in_file(tree, relative_path, variables):
+    content = tree.read(relative_path).decode('utf-8')
+    for key, value in variables.items():
+        content = content.replace(f"%{key}%", str(value))
 
+    tree.write(relative_path, content.encode('utf-8'))
+
+def find_resolution_specific_texture(source_index, version_relative_path, target_height):
+    """Find if there is a resolution-specific texture available in the source directory."""
     logging.warning(f"Checking for {target_height}px height texture version of: {version_relative_path}")
-    logging.warning(f"At location: {resolution_specific_path}")
+    resolution_specific_path = source_index.find_override(version_relative_path, target_height)
 
-    if os.path.exists(resolution_specific_path):
+    if resolution_specific_path:
         logging.warning(f"Found resolution-specific texture: {resolution_specific_path}")
-        return True, resolution_specific_path
+        return True, source_index.path(resolution_specific_path)
     else:
-        logging.warning(f"Resolution-specific texture not found, using original: {os.path.join(source_dir, version_relative_path)}")
-        return False, os.path.join(source_dir, version_relative_path)
+        logging.warning(f"Resolution-specific texture not found, using original: {version_relative_path}")
+        return False, source_index.path(version_relative_path)
 
 def bleed_alpha(img, bleed_distance, background_color='black'):
     """Bleed the colors of the RGB channels into the transparent regions."""
@@ -162,10 +134,64 @@ def bleed_alpha(img, bleed_distance, background_color='black'):
     # Merge the bleed RGB with the original alpha channel
     return Image.merge("RGBA", (*bleed_rgb.split(), alpha))
 
-def scale_texture_with_separate_channels(img, scale_factor, bleed_distance=16):
+def bleed_alpha_nearest(img, bleed_distance, background_color=(0, 0, 0)):
+    """Fill transparent pixels with the color of their nearest opaque pixel, up to bleed_distance pixels away."""
+    if img.mode != 'RGBA':
+        return img
+    return Image.fromarray(bleed_alpha_nearest_batch(np.asarray(img)[None], bleed_distance, background_color)[0], 'RGBA')
+
+# Bleed implementations selectable with the bleed_mode build option, 'dilate' is the original mask based bleed
+BLEED_MODES = {
+    'nearest': bleed_alpha_nearest,
+    'dilate': bleed_alpha,
+}
+
+# Radius of the resample kernels in destination pixels
+RESAMPLE_SUPPORT = {
+    'NEAREST': 0.5,
+    'BOX': 0.5,
+    'BILINEAR': 1,
+    'BICUBIC': 2,
+    'LANCZOS': 3,
+}
+
+def get_bleed_distance(scale_factor, bleed_mode='nearest', rgb_filter='LANCZOS'):
+    """Number of source pixels the resample kernel can reach into transparent areas, plus one pixel of margin."""
+    if bleed_mode == 'dilate':
+        return 16
+    return math.ceil(RESAMPLE_SUPPORT[rgb_filter] / scale_factor) + 1
+
+def downsample_settings(scale_factor, bleed_mode='nearest', alpha_mode='SEPARATE', resample_filter='LANCZOS'):
+    """Settings that decide the output of one downsample, used as part of the texture cache key."""
+    if resample_filter != 'LANCZOS':
+        # BOX falls back to LANCZOS with the bleed mode when the reduction isn't by an integer factor
+        return {
+            'scale_factor': scale_factor,
+            'resample_filter': resample_filter,
+            'alpha_mode': alpha_mode,
+            'bleed_mode': bleed_mode,
+        }
+    if alpha_mode != 'SEPARATE':
+        return {
+            'scale_factor': scale_factor,
+            'alpha_mode': alpha_mode,
+            'filter': 'LANCZOS',
+        }
+    return {
+        'scale_factor': scale_factor,
+        'bleed_mode': bleed_mode,
+        'bleed_distance': get_bleed_distance(scale_factor, bleed_mode),
+        'bleed_color': 'black',
+        'rgb_filter': 'LANCZOS',
+        'alpha_filter': 'NEAREST',
+    }
+
+def scale_texture_with_separate_channels(img, scale_factor, bleed_distance=None, bleed_mode='nearest'):
     """Scale RGB and alpha channels separately with alpha bleeding."""
     if img.mode == 'RGBA':
-        img_bleeded = bleed_alpha(img, bleed_distance)
+        if bleed_distance is None:
+            bleed_distance = get_bleed_distance(scale_factor, bleed_mode)
+        img_bleeded = BLEED_MODES[bleed_mode](img, bleed_distance)
         rgb, alpha = img_bleeded.split()[:3], img_bleeded.split()[3]
         rgb = Image.merge("RGB", rgb)
         rgb_resized = rgb.resize((int(rgb.width * scale_factor), int(rgb.height * scale_factor)), Image.LANCZOS)
@@ -175,95 +201,354 @@ def scale_texture_with_separate_channels(img, scale_factor, bleed_distance=16):
         img_resized = img.resize((int(img.width * scale_factor), int(img.height * scale_factor)), Image.LANCZOS)
     return img_resized
 
-def process_file(source_dir, dest_dir, original_path, uid_info, scale_factor, variables):
-    full_source_path = os.path.join(source_dir, original_path.replace('/', os.sep))
-    full_dest_path = os.path.join(dest_dir, original_path.replace('/', os.sep))
+def scale_texture(img, scale_factor, bleed_mode='nearest', alpha_mode='SEPARATE', resample_filter='LANCZOS'):
+    """Scale one image with the alpha mode and resample filter of its UID."""
+    if resample_filter == 'BOX' and not box_factor(img.width, img.height, scale_factor):
+        resample_filter = 'LANCZOS'
+    if alpha_mode == 'SEPARATE' and resample_filter == 'LANCZOS':
+        return scale_texture_with_separate_channels(img, scale_factor, bleed_mode=bleed_mode)
+    if img.mode not in BATCH_MODES:
+        return img.resize((int(img.width * scale_factor), int(img.height * scale_factor)), getattr(Image, resample_filter))
+    return Image.fromarray(scale_texture_stack(np.asarray(img)[None], scale_factor, alpha_mode, resample_filter)[0], img.mode)
+
+# Image modes the batched resize stage can stack, and the most pixels it stacks in one call
+BATCH_MODES = ('RGBA', 'RGB')
+BATCH_MAX_PIXELS = 1 << 22
+# Size of the tiles textures too large for the memory budget are resampled in
+TILE_SIZE = 256
+
+# How a texture's resolution levels are derived: DIRECT resamples every level from the source,
+# PROGRESSIVE halves the previous level. Picked per UID with the 'pyramid' key of the source mapping.
+PYRAMID_MODES = ('DIRECT', 'PROGRESSIVE')
+
+def get_pyramid_mode(uid_info, texture_options):
+    pyramid_mode = uid_info.get('pyramid', texture_options.get('pyramid_mode', 'DIRECT')).upper()
+    if pyramid_mode not in PYRAMID_MODES:
+        logging.warning(f"Warning: Unknown pyramid mode '{pyramid_mode}' for {uid_info.get('path')}, using DIRECT")
+        return 'DIRECT'
+    return pyramid_mode
+
+# How the alpha of RGBA textures is resampled: SEPARATE bleeds colors into transparent pixels and resizes RGB and
+# alpha on their own, CUTOUT and SMOOTH resize premultiplied colors and alpha in one pass. CUTOUT keeps alpha binary
+# for foliage and other cutouts, SMOOTH filters it for glass and particles. Picked per UID with the 'alpha' key of
+# the source mapping.
+ALPHA_MODES = ('SEPARATE', 'CUTOUT', 'SMOOTH')
+
+def get_alpha_mode(uid_info, texture_options, img_info):
+    if img_info.mode != 'RGBA':
+        return 'SEPARATE'
+    alpha_mode = uid_info.get('alpha', texture_options.get('alpha_mode', 'SEPARATE')).upper()
+    if alpha_mode not in ALPHA_MODES:
+        logging.warning(f"Warning: Unknown alpha mode '{alpha_mode}' for {uid_info.get('path')}, using SEPARATE")
+        return 'SEPARATE'
+    return alpha_mode
+
+# Filter textures are downsampled with: LANCZOS for detailed textures, BOX averages blocks of an exact integer
+# reduction and NEAREST picks one pixel of each, both for flat pixel art. Neither needs an alpha bleed. BOX falls
+# back to LANCZOS for other reductions. Picked per UID with the 'resample' key of the source mapping.
+RESAMPLE_FILTERS = ('LANCZOS', 'BOX', 'NEAREST')
+
+def get_resample_filter(uid_info, texture_options):
+    resample_filter = uid_info.get('resample', texture_options.get('resample_filter', 'LANCZOS')).upper()
+    if resample_filter not in RESAMPLE_FILTERS:
+        logging.warning(f"Warning: Unknown resample filter '{resample_filter}' for {uid_info.get('path')}, using LANCZOS")
+        return 'LANCZOS'
+    return resample_filter
+
+def get_halving_steps(scale_factor):
+    """Number of halvings from the source down to scale_factor, or None if scale_factor is not a power of two."""
+    steps = -math.log2(scale_factor)
+    return int(steps) if steps.is_integer() and steps > 0 else None
+
+def texture_settings(scale_factor, pyramid_mode, bleed_mode='nearest', alpha_mode='SEPARATE', resample_filter='LANCZOS'):
+    """Settings that decide the output of one pyramid level, used as part of the texture cache key."""
+    steps = get_halving_steps(scale_factor)
+    if pyramid_mode == 'PROGRESSIVE' and steps and steps > 1:
+        return {'pyramid': 'PROGRESSIVE', 'steps': [downsample_settings(0.5, bleed_mode, alpha_mode, resample_filter)] * steps}
+    return downsample_settings(scale_factor, bleed_mode, alpha_mode, resample_filter)
+
+def build_pyramid(source, scale_factors, pyramid_mode, scale):
+    """Downsample one decoded source to every scale factor with scale(image, scale_factor), returns {scale_factor: result}.
+
+    PROGRESSIVE levels are halved from the level above, scale factors that are not powers of two are always
+    resampled directly from the source.
+    """
+    levels = {}
+    if pyramid_mode == 'PROGRESSIVE':
+        max_steps = max((get_halving_steps(scale_factor) or 0 for scale_factor in scale_factors), default=0)
+        level = source
+        for step in range(1, max_steps + 1):
+            level = scale(level, 0.5)
+            if 0.5 ** step in scale_factors:
+                levels[0.5 ** step] = level
+
+    for scale_factor in scale_factors:
+        if scale_factor not in levels:
+            levels[scale_factor] = scale(source, scale_factor)
+    return levels
+
+def find_passthrough_texture(source_index, original_path, img_info, scale_factor):
+    """Return the file a PNG is used from as it is at scale_factor, or None if it has to be downsampled.
+
+    Native resolution textures and resolution overrides are passed through without a decode or encode.
+    """
+    target_height = int(img_info.height * scale_factor)
+    override_exists, resolution_specific_texture = find_resolution_specific_texture(source_index, original_path, target_height)
+    if scale_factor == 1 or override_exists:
+        return resolution_specific_texture
+    return None
+
+def process_file(source_index, levels, original_path, uid_info, texture_cache=None, texture_options=None, batch_queue=None, dedup=None, source_hashes=None):
+    """Process one source file into the tree of every resolution level.
+
+    levels is a list of dicts with the 'scale_factor', 'tree' and pack 'variables' of each resolution. The source
+    is decoded at most once for all of them. If batch_queue is given, PNGs the batched resize stage can handle are
+    queued there instead of processed. If dedup is given, a ContentDedup, levels whose source content and settings
+    were claimed before are skipped and left for its emit. Texture cache keys use the hash from source_hashes, the
+    build's source tree hashes, a file missing from them is hashed here.
+    """
+    texture_options = texture_options or {}
+    bleed_mode = texture_options.get('bleed_mode', 'nearest')
+    png_profile = texture_options.get('png_profile', 'release')
+    # Lossless palette and grayscale reduction of the output, a UID opts out with "reduce_colors": "FALSE"
+    reduce_colors = texture_options.get('reduce_colors', True) and uid_info.get('reduce_colors') != "FALSE"
+    full_source_path = source_index.path(original_path)
 
     # Check if file exists
-    if not os.path.exists(full_source_path):
+    if not source_index.exists(original_path):
         logging.warning(f"Warning: Source file not found - {full_source_path}")
         return
 
-    # Ensure the destination directory exists
-    os.makedirs(os.path.dirname(full_dest_path), exist_ok=True)
-
-    # Ensure the destination directory exists
-    os.makedirs(os.path.dirname(full_dest_path), exist_ok=True)
-
-    # Skip resizing if 'downsample' is set to FALSE
+    # Skip resizing if 'downsample' is set to FALSE, the original bytes are passed through untouched
     if uid_info.get('downsample') == "FALSE":
         logging.info(f"Skipping downsample for: {original_path}")
-        shutil.copy(full_source_path, full_dest_path)
+        for level in levels:
+            level['tree'].link_file(original_path, full_source_path)
     elif full_source_path.lower().endswith('.png'):
         # For PNG files, proceed with resizing and processing
-        img_height = Image.open(full_source_path).height
-        target_height = int(img_height * scale_factor)
-        override_exists, resolution_specific_texture = find_resolution_specific_texture(source_dir, original_path, target_height)
-        
-        with Image.open(resolution_specific_texture) as img:
-            if not override_exists:
-                img = scale_texture_with_separate_channels(img, scale_factor)
-            img.save(full_dest_path)
+        img_info = image_index.get(full_source_path, source_index.stat(original_path))
+        pyramid_mode = get_pyramid_mode(uid_info, texture_options)
+        alpha_mode = get_alpha_mode(uid_info, texture_options, img_info)
+        resample_filter = get_resample_filter(uid_info, texture_options)
+        source_hash = None
+        pending = []
+
+        for level in levels:
+            scale_factor = level['scale_factor']
+            passthrough_texture = find_passthrough_texture(source_index, original_path, img_info, scale_factor)
+            if passthrough_texture:
+                logging.info(f"Passing through: {passthrough_texture}")
+                level['tree'].link_file(original_path, passthrough_texture)
+                continue
+
+            settings = {**texture_settings(scale_factor, pyramid_mode, bleed_mode, alpha_mode, resample_filter), 'png_profile': png_profile, 'reduce_colors': reduce_colors}
+            if dedup and uid_info.get('inject') != "TRUE":
+                source_hash = source_hash or dedup.source_hash(original_path, full_source_path)
+                if dedup.claim(level, original_path, source_hash, settings):
+                    # Same content and settings as a texture already processed or queued for this level
+                    continue
+
+            cache_key = None
+            if texture_cache:
+                source_hash = source_hash or (source_hashes or {}).get(original_path) or hash_file(full_source_path)
+                cache_key = texture_cache.make_key(source_hash, settings)
+                cached_texture = texture_cache.fetch(cache_key)
+                if cached_texture is not None:
+                    logging.info(f"Using cached texture for: {original_path}")
+                    level['tree'].write(original_path, cached_texture)
+                    level['tree'].note_encoded(texture_cache.fetch_info(cache_key).get('saved_bytes', 0) if reduce_colors else 0)
+                    continue
+
+            pending.append((level, cache_key))
+
+        if pending:
+            memory_budget = get_memory_budget()
+            # Textures resampled without an alpha bleed batch under any bleed mode
+            separate_lanczos = alpha_mode == 'SEPARATE' and resample_filter == 'LANCZOS'
+            needs_bleed = alpha_mode == 'SEPARATE' and resample_filter != 'NEAREST'
+            batchable = (bleed_mode == 'nearest' or not needs_bleed) and img_info.mode in BATCH_MODES and uid_info.get('inject') != "TRUE"
+            if batchable and separate_lanczos and not memory_budget.fits(texture_footprint(img_info.width, img_info.height)):
+                # Too large for the memory budget, resample it on its own a tile at a time
+                memory_budget.note_oversized(original_path)
+                process_texture_tiled(original_path, full_source_path, img_info, pyramid_mode, pending, texture_cache, reduce_colors)
+                return
+
+            if batch_queue is not None and batchable:
+                batch_queue[original_path] = (full_source_path, img_info, pyramid_mode, alpha_mode, resample_filter, pending, reduce_colors)
+                return
+
+            footprint = texture_footprint(img_info.width, img_info.height, 'pillow' if separate_lanczos else 'batch')
+            with memory_budget.reserve(footprint, original_path):
+                with Image.open(full_source_path) as img:
+                    img.load()
+                    resized = build_pyramid(img, [level['scale_factor'] for level, _ in pending], pyramid_mode,
+                                            lambda img, scale_factor: scale_texture(img, scale_factor, bleed_mode, alpha_mode, resample_filter))
+
+            for level, cache_key in pending:
+                saved = level['tree'].save_image(original_path, resized[level['scale_factor']], reduce_colors, format='PNG')
+                if cache_key:
+                    texture_cache.store(cache_key, level['tree'].read(original_path), {'saved_bytes': saved} if saved else None)
     else:
-        # Copy non-PNG files directly
-        shutil.copy(full_source_path, full_dest_path)
+        # Pass non-PNG files through directly
+        for level in levels:
+            level['tree'].link_file(original_path, full_source_path)
 
     # Handle 'inject' flag
     if uid_info.get('inject') == "TRUE":
-        replace_variables_in_file(full_dest_path, variables)
-
-def resolution_adjustments(source_dir, dest_dir, mappings, uid_mappings, scale_factor, pack_variables):
-    os.makedirs(dest_dir, exist_ok=True)
+        for level in levels:
+            replace_variables_in_file(level['tree'], original_path, level['variables'])
+
+def load_texture_array(file_path, mode):
+    with Image.open(file_path) as img:
+        if img.mode != mode:
+            img = img.convert(mode)
+        return np.array(img)
+
+def scale_texture_stack(stack, scale_factor, alpha_mode='SEPARATE', resample_filter='LANCZOS'):
+    """Batched equivalent of scale_texture for a N x H x W x C stack, with the nearest alpha bleed."""
+    height, width = stack.shape[1:3]
+    if resample_filter == 'NEAREST':
+        return scale_textures_nearest(stack, scale_factor, alpha_mode)
+    if resample_filter == 'BOX' and box_factor(width, height, scale_factor):
+        return scale_textures_box(stack, scale_factor, alpha_mode)
+    if alpha_mode != 'SEPARATE':
+        return scale_textures_premultiplied(stack, scale_factor, alpha_mode)
+    return scale_textures_batch(stack, scale_factor, get_bleed_distance(scale_factor, 'nearest'))
+
+def store_texture_levels(original_path, pending, resized, mode, texture_cache=None, reduce_colors=True):
+    """Save the downsampled levels of a texture into the tree of every pending level and the texture cache."""
+    for level, cache_key in pending:
+        saved = level['tree'].save_image(original_path, Image.fromarray(resized[level['scale_factor']], mode), reduce_colors, format='PNG')
+        if cache_key:
+            texture_cache.store(cache_key, level['tree'].read(original_path), {'saved_bytes': saved} if saved else None)
+
+def process_texture_tiled(original_path, full_source_path, img_info, pyramid_mode, pending, texture_cache=None, reduce_colors=True):
+    """Downsample a texture too large for the memory budget on its own, with the float temporaries of one tile alive at a time."""
+    scale_factors = [level['scale_factor'] for level, _ in pending]
+    with get_memory_budget().reserve(texture_footprint(img_info.width, img_info.height, 'tiled', TILE_SIZE), original_path):
+        texture = load_texture_array(full_source_path, img_info.mode)
+        resized = build_pyramid(texture, scale_factors, pyramid_mode,
+                                lambda texture, scale_factor: scale_texture_tiled(texture, scale_factor, get_bleed_distance(scale_factor, 'nearest'), TILE_SIZE))
+        store_texture_levels(original_path, pending, resized, img_info.mode, texture_cache, reduce_colors)
+
+def process_texture_batches(batch_queue, texture_cache=None):
+    """Downsample queued textures grouped by size, mode and pending levels, decoding each texture once for all levels.
+
+    Batches are sized so each fits in the memory budget and reserve their footprint before decoding.
+    """
+    memory_budget = get_memory_budget()
+    groups = {}
+    for original_path, (full_source_path, img_info, pyramid_mode, alpha_mode, resample_filter, pending, reduce_colors) in batch_queue.items():
+        scale_factors = tuple(level['scale_factor'] for level, _ in pending)
+        groups.setdefault((img_info.width, img_info.height, img_info.mode, pyramid_mode, alpha_mode, resample_filter, scale_factors), []).append((original_path, full_source_path, pending, reduce_colors))
+
+    for (width, height, mode, pyramid_mode, alpha_mode, resample_filter, scale_factors), textures in groups.items():
+        scale = lambda stack, scale_factor: scale_texture_stack(stack, scale_factor, alpha_mode, resample_filter)
+        footprint = texture_footprint(width, height)
+        chunk_size = max(1, BATCH_MAX_PIXELS // (width * height))
+        if memory_budget.limit:
+            chunk_size = max(1, min(chunk_size, memory_budget.limit // footprint))
+        for start in range(0, len(textures), chunk_size):
+            chunk = textures[start:start + chunk_size]
+            with memory_budget.reserve(footprint * len(chunk), f"{len(chunk)} textures of {width}x{height}"):
+                stack = np.stack([load_texture_array(full_source_path, mode) for _, full_source_path, _, _ in chunk])
+                resized_stacks = build_pyramid(stack, scale_factors, pyramid_mode, scale)
+
+                for index, (original_path, _, pending, reduce_colors) in enumerate(chunk):
+                    store_texture_levels(original_path, pending, {scale_factor: resized_stack[index] for scale_factor, resized_stack in resized_stacks.items()}, mode,
+                                         texture_cache, reduce_colors)
+
+    logging.warning(f"Batch resized {len(batch_queue)} textures in {len(groups)} size groups")
+
+def stamp_source_paths(mappings, uid_mappings):
+    """Paths of the textures stamp and TGA atlases crop from.
+
+    Their resolution tree copies are not color reduced: a crop past the edge of a palette or grayscale image pads
+    with an opaque color where the original RGBA image pads with transparent pixels. The atlases themselves are.
+    """
+    return {uid_mappings.get(atlas_mapping['uid'], {}).get('path') for mapping in mappings if mapping.get('type') in ('stamp', 'tga')
+            for atlas_mapping in mapping['source']}
+
+def texture_uid_info(uid_info, stamp_paths):
+    """The UID entry a texture is processed with, color reduction is turned off for stamp sources."""
+    if uid_info.get('path') in stamp_paths:
+        return {**uid_info, 'reduce_colors': "FALSE"}
+    return uid_info
+
+def resolution_adjustments(source_index, levels, mappings, uid_mappings, texture_cache=None, texture_options=None, dedup=None, source_hashes=None):
+    """Process every source file the mappings use into the resolution tree of each level.
+
+    With dedup, source textures with identical content are processed once and their output copied to the others.
+    """
     total_files = len(mappings)
     warnings=[]
+    batch_queue = {} if (texture_options or {}).get('batch_resize', True) else None
+    stamp_paths = stamp_source_paths(mappings, uid_mappings)
 
     for i, mapping in enumerate(mappings, 1):
         if mapping.get('type') == 'grid':
             # Process grid type atlas
             for uid in mapping['source']:
                 uid_info = uid_mappings.get(uid, {})
-                original_path = get_path(source_dir, uid_info)
+                original_path = get_path(source_index, uid_info)
                 if original_path:
                     logging.warning(f"Processing grid UID '{uid}': {original_path}")
                     downsample = uid_info.get('downsample', '')
                     logging.warning(f"Downsample '{uid}'?: {downsample}")
-                    process_file(source_dir, dest_dir, original_path, uid_info, scale_factor, pack_variables)
+                    process_file(source_index, levels, original_path, texture_uid_info(uid_info, stamp_paths), texture_cache, texture_options, batch_queue, dedup, source_hashes)
         elif mapping.get('type') in ['stamp', 'tga']:
             # Process stamp type atlas
             for atlas_mapping in mapping['source']:
                 uid = atlas_mapping['uid']
                 uid_info = uid_mappings.get(uid, {})
-                original_path = get_path(source_dir, uid_info)
+                original_path = get_path(source_index, uid_info)
                 if original_path:
                     logging.warning(f"Processing stamp UID '{uid}': {original_path}")
                     downsample = uid_info.get('downsample', '')
                     logging.warning(f"Downsample '{uid}'?: {downsample}")
-                    process_file(source_dir, dest_dir, original_path, uid_info, scale_factor, pack_variables)
+                    process_file(source_index, levels, original_path, texture_uid_info(uid_info, stamp_paths), texture_cache, texture_options, batch_queue, dedup, source_hashes)
         else:
             # Process regular texture
             uid = mapping['source']
             uid_info = uid_mappings.get(uid, {})
-            original_path = get_path(source_dir, uid_info)
+            original_path = get_path(source_index, uid_info)
             if original_path:
                 logging.warning(f"Processing regular texture '{uid}': {original_path}")
                 downsample = uid_info.get('downsample', '')
                 logging.warning(f"Downsample '{uid}'?: {downsample}")
-                process_file(source_dir, dest_dir, original_path, uid_info, scale_factor, pack_variables)
+                process_file(source_index, levels, original_path, texture_uid_info(uid_info, stamp_paths), texture_cache, texture_options, batch_queue, dedup, source_hashes)
 
         #print(f"\r[{i}/{total_files}] source files found...", end="")
 
-def apply_mappings(resolution_dir, dest_dir, mappings, uid_mappings):
+    if batch_queue:
+        process_texture_batches(batch_queue, texture_cache)
+    if dedup:
+        dedup.emit()
+
+def get_tree_path(tree, source):
+    """Same as get_path, for a processed pack tree instead of the source folder."""
+    path = source.get('path', '')
+    if path and not tree.exists(path):
+        fallback = source.get('fallback', '')
+        if os.path.exists(fallback):
+            tree.link_file(path, fallback)
+
+    return path
+
+def apply_mappings(resolution_tree, dest_tree, mappings, uid_mappings, label=None, image_cache_size_mb=256, atlas_backend='numpy'):
     total_files = len(mappings)
-    logging.warning(f"Processing version in {dest_dir}:")
-    print(f"Processing version in {dest_dir}:")
+    logging.warning(f"Processing version in {label}:")
+    print(f"Processing version in {label}:")
     warnings = []
+    # Every atlas of the target reads its sources through one cache, so repeated stamps are decoded once
+    image_cache = DecodedImageCache(image_cache_size_mb)
 
     for i, mapping in enumerate(mappings, 1):
         if mapping.get('type') in ['grid', 'stamp', 'tga']:
-            atlas_handler = AtlasHandler()
+            atlas_handler = AtlasHandler(image_cache, atlas_backend)
 
             atlas_mappings = mapping['source']
-            dest_path = os.path.join(dest_dir, mapping['destination'])
+            dest_path = mapping['destination']
             atlas_type = mapping['type']
 
             # Check if at least one image exists for the atlas
@@ -272,8 +557,7 @@ def apply_mappings(resolution_dir, dest_dir, mappings, uid_mappings):
                 if atlas_type in ['stamp', 'tga']:
                     source = source['uid']
                 uid_info = uid_mappings.get(source, {})
-                img_path = os.path.join(resolution_dir, get_path(resolution_dir, uid_info).replace('/', os.sep))
-                if os.path.exists(img_path):
+                if resolution_tree.exists(get_tree_path(resolution_tree, uid_info)):
                     atlas_has_valid_image = True
                     break
 
@@ -283,10 +567,10 @@ def apply_mappings(resolution_dir, dest_dir, mappings, uid_mappings):
 
             if atlas_type == 'grid':
                 grid_size = tuple(mapping['grid_size'])
-                atlas_handler.compile_atlas(resolution_dir, atlas_mappings, dest_path, atlas_type, uid_mappings, grid_size)
+                atlas_handler.compile_atlas(resolution_tree, atlas_mappings, dest_tree, dest_path, atlas_type, uid_mappings, grid_size)
             elif atlas_type in ['stamp', 'tga']:
                 canvas_size = tuple(mapping['canvas_size'])
-                atlas_handler.compile_atlas(resolution_dir, atlas_mappings, dest_path, atlas_type, uid_mappings, canvas_size=canvas_size)
+                atlas_handler.compile_atlas(resolution_tree, atlas_mappings, dest_tree, dest_path, atlas_type, uid_mappings, canvas_size=canvas_size)
             else:
                 logging.warning(f"Warning: Unknown atlas type - {atlas_type}")
 
@@ -294,59 +578,269 @@ def apply_mappings(resolution_dir, dest_dir, mappings, uid_mappings):
         else:
             uid = mapping['source']
             uid_info = uid_mappings.get(uid, {})
-            original_path = get_path(resolution_dir, uid_info)
+            original_path = get_tree_path(resolution_tree, uid_info)
             if original_path:
-                source_path = os.path.join(resolution_dir, original_path.replace('/', os.sep))
-                dest_path = os.path.join(dest_dir, mapping['destination'].replace('/', os.sep))
-
-                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-                if os.path.exists(source_path):
-                    shutil.copy2(source_path, dest_path)
+                if resolution_tree.exists(original_path):
+                    dest_tree.write(mapping['destination'], resolution_tree.read(original_path))
                     #print(f"\r[{i}/{total_files}] files copied...", end="")
                 else:
-                    logging.warning(f"Warning: Source file not found - {source_path}")
-
-def create_zip_from_folder(folder_path, zip_path):
-    """ Create a zip file from a folder """
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zipf.write(file_path, os.path.relpath(file_path, folder_path))
-
-def main(config_path):
-    build_config = load_yml_config(config_path)
-
-    source_dir = build_config['source_dir']
+                    logging.warning(f"Warning: Source file not found - {original_path}")
+
+    image_cache.log_stats(label)
+
+def create_target_manifest(target, pack_variables, mappings, uid_mappings, context):
+    """Record every input of a build target: builder, pack variables, texture and zip options, mapping files, UID
+    entries and source textures."""
+    manifest = BuildManifest()
+    manifest.add('builder', context['builder_hash'])
+    manifest.add_value('pack_variables', pack_variables)
+    manifest.add_value('texture_options', context['texture_options'])
+    # Only the compression policy decides the zip's bytes, threads and entry reuse don't
+    zip_options = context['zip_options']
+    manifest.add_value('zip_options', {'stored_extensions': zip_options['stored_extensions'], 'deflate_level': zip_options['deflate_level']})
+
+    version_dir = os.path.join(target['platform_mappings_dir'], target['version'])
+    for category_file in sorted(os.listdir(version_dir)):
+        manifest.add_file(f"mapping:{category_file}", os.path.join(version_dir, category_file))
+
+    for mapping in mappings:
+        for uid in mapping_uids(mapping):
+            uid_info = uid_mappings.get(uid, {})
+            manifest.add_value(f"uid:{uid}", uid_info)
+            if uid_info.get('path'):
+                manifest.add_source_texture(uid_info['path'], context['source_hashes'], context['resolution_overrides'])
+
+    return manifest
+
+def create_target_trees(build_config, target, context):
+    """Create the resolution and version trees a target is built in."""
+    if context['debug_temp']:
+        # Every target gets its own working directory so parallel jobs never share temp files
+        tempfile_dir = build_config['tempfile_dir']
+        os.makedirs(tempfile_dir, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix=f"{target['platform']}_{target['version']}_{target['scale_name']}_", dir=tempfile_dir)
+        logging.warning(f"Keeping intermediate files for {target['zip_file_name']} in {work_dir}")
+        return DirectoryTree(os.path.join(work_dir, "resolution"), context['png_encoder']), DirectoryTree(os.path.join(work_dir, "version"), context['png_encoder'])
+
+    # Stream processed textures and atlases through memory straight into the zip
+    return MemoryTree(context['png_encoder']), MemoryTree(context['png_encoder'])
+
+def get_target_paths(build_config, target, context):
+    """Return the zip path and build manifest path of a target."""
+    zip_path = os.path.join(build_config['output_dir'], target['zip_file_name'])
+    manifest_path = os.path.join(context['manifest_dir'], f"{target['zip_file_name']}.json")
+    return zip_path, manifest_path
+
+def report_color_reduction(target, encode_stats):
+    """Report how much lossless palette and grayscale reduction saved on the PNGs a target encoded."""
+    if not encode_stats['reduced']:
+        return
+    message = (f"Color reduction for {target['zip_file_name']}: {encode_stats['reduced']} of {encode_stats['encoded']} output PNGs reduced, "
+               f"{encode_stats['saved_bytes'] / 1024:.0f} KB saved")
+    logging.warning(message)
+    print(message)
+
+def build_targets(build_config, targets, context):
+    """Build the pack zips for targets that share a platform and version, in one pass over the source textures.
+
+    Every source texture is decoded once and downsampled to all resolutions of the group. Returns the zip paths.
+    """
+    source_index = get_source_index(build_config['source_dir'])
+    texture_cache = context['texture_cache']
+    mapping_store = get_build_mapping_store(build_config)
+
+    platform = targets[0][0]['platform']
+    version = targets[0][0]['version']
+
+    uid_mappings = mapping_store.uid_mappings(platform, version)
+    mappings = mapping_store.mappings(platform, version)
+
+    levels = []
+    for target, pack_variables in targets:
+        zip_path, manifest_path = get_target_paths(build_config, target, context)
+        resolution_tree, version_tree = create_target_trees(build_config, target, context)
+        levels.append({
+            'target': target,
+            'scale_factor': target['scale_factor'],
+            'variables': pack_variables,
+            'tree': resolution_tree,
+            'version_tree': version_tree,
+            'manifest': create_target_manifest(target, pack_variables, mappings, uid_mappings, context),
+            'manifest_path': manifest_path,
+            'entry_index_path': os.path.join(context['manifest_dir'], f"{target['zip_file_name']}.entries.json"),
+            'zip_path': zip_path,
+        })
+
+    if texture_cache:
+        texture_cache.hits = texture_cache.misses = 0
+    png_encoder = context['png_encoder']
+    if png_encoder.cache:
+        png_encoder.cache.hits = png_encoder.cache.misses = 0
+
+    dedup = ContentDedup(context['source_hashes']) if context['texture_options'].get('dedup_sources', True) else None
+    resolution_adjustments(source_index, levels, mappings, uid_mappings, texture_cache, context['texture_options'], dedup, context['source_hashes'])
+    if dedup:
+        dedup.report(f"{platform} {version}")
+    if texture_cache:
+        logging.warning(f"Texture cache for {platform} {version}: {texture_cache.hits} hits, {texture_cache.misses} misses")
+
+    zip_paths = []
+    for level in levels:
+        target = level['target']
+        apply_mappings(level['tree'], level['version_tree'], mappings, uid_mappings, label=f"{platform} {version} {target['scale_name']}",
+                       image_cache_size_mb=context['atlas_image_cache_mb'], atlas_backend=context['atlas_backend'])
+
+        # Update pack.mcmeta and create zip file for each version
+        # Unless forced, entries unchanged since the last build are copied across from the existing zip
+        create_zip_from_tree(level['version_tree'], level['zip_path'], context['zip_options'], level['entry_index_path'],
+                             update=context['zip_options']['update'] and not context['force'])
+        level['manifest'].save(level['manifest_path'])
+        logging.warning(f"Created zip file: {level['zip_path']}")
+        zip_paths.append(level['zip_path'])
+        report_color_reduction(target, level['tree'].encode_stats + level['version_tree'].encode_stats)
+
+        # Release the trees of finished resolutions before zipping the next one
+        level['tree'] = level['version_tree'] = None
+
+    png_encoder.log_stats(f"{platform} {version}")
+    return zip_paths
+
+def group_build_targets(targets, resolution_pyramid=True):
+    """Group targets that share a platform and version so their resolutions are built from a single decode.
+
+    Without resolution_pyramid every target is built on its own.
+    """
+    if not resolution_pyramid:
+        return [[target] for target in targets]
+
+    groups = {}
+    for target, target_variables in targets:
+        groups.setdefault((target['platform'], target['version']), []).append((target, target_variables))
+    return list(groups.values())
+
+# Most shared textures processed by one shared texture job
+SHARED_CHUNK_SIZE = 256
+
+def plan_build(build_config, target_groups, context):
+    """Plan a build run: drop up to date targets and find the texture work target groups have in common.
+
+    Every downsampled texture is a node keyed by (source file, pyramid mode, alpha mode, resample filter, scale
+    factor), so a texture that
+    resolves to the same file in several versions or platforms is one node. Nodes used by more than one group are
+    produced once by the shared texture stage before any group is built, one job per source file so it is
+    decoded once for all its levels, most expensive first.
+
+    Returns the groups left to build, the up to date targets and the shared texture jobs.
+    """
+    source_index = get_source_index(build_config['source_dir'])
+    texture_options = context['texture_options']
+    stale_groups = []
+    up_to_date = []
+    nodes = {}
+
+    mapping_store = get_build_mapping_store(build_config)
+
+    for group in target_groups:
+        platform = group[0][0]['platform']
+        version = group[0][0]['version']
+        uid_mappings = mapping_store.uid_mappings(platform, version)
+        mappings = mapping_store.mappings(platform, version)
+
+        # Skip targets whose inputs are identical to the ones recorded for the existing zip
+        stale_targets = []
+        for target, pack_variables in group:
+            zip_path, manifest_path = get_target_paths(build_config, target, context)
+            manifest = create_target_manifest(target, pack_variables, mappings, uid_mappings, context)
+            if not context['force'] and os.path.exists(zip_path) and manifest.matches(manifest_path):
+                logging.warning(f"Up to date, skipping: {zip_path}")
+                up_to_date.append(target)
+            else:
+                stale_targets.append((target, pack_variables))
+
+        if not stale_targets:
+            continue
+        group_index = len(stale_groups)
+        stale_groups.append(stale_targets)
+
+        stamp_paths = stamp_source_paths(mappings, uid_mappings)
+        for mapping in mappings:
+            for uid in mapping_uids(mapping):
+                uid_info = texture_uid_info(uid_mappings.get(uid, {}), stamp_paths)
+                original_path = uid_info.get('path', '')
+                if not original_path.lower().endswith('.png') or uid_info.get('downsample') == "FALSE" or uid_info.get('inject') == "TRUE":
+                    continue
+                if not source_index.exists(original_path):
+                    continue
+
+                img_info = image_index.get(source_index.path(original_path), source_index.stat(original_path))
+                pyramid_mode = get_pyramid_mode(uid_info, texture_options)
+                alpha_mode = get_alpha_mode(uid_info, texture_options, img_info)
+                resample_filter = get_resample_filter(uid_info, texture_options)
+                for target, _ in stale_targets:
+                    if find_passthrough_texture(source_index, original_path, img_info, target['scale_factor']):
+                        continue
+                    node = nodes.setdefault((original_path, pyramid_mode, alpha_mode, resample_filter, target['scale_factor']), {
+                        'uid_info': uid_info,
+                        'pixels': img_info.width * img_info.height,
+                        'groups': set(),
+                    })
+                    node['groups'].add(group_index)
+
+    shared_jobs = {}
+    for (original_path, pyramid_mode, alpha_mode, resample_filter, scale_factor), node in nodes.items():
+        if len(node['groups']) < 2:
+            continue
+        job = shared_jobs.setdefault((original_path, pyramid_mode, alpha_mode, resample_filter), {
+            'original_path': original_path,
+            'uid_info': node['uid_info'],
+            'scale_factors': [],
+            'cost': 0,
+        })
+        job['scale_factors'].append(scale_factor)
+        job['cost'] += node['pixels']
+
+    shared_jobs = sorted(shared_jobs.values(), key=lambda job: job['cost'], reverse=True)
+    if shared_jobs:
+        shared_nodes = sum(len(job['scale_factors']) for job in shared_jobs)
+        logging.warning(f"Build plan: {shared_nodes} of {len(nodes)} texture nodes are shared between target groups")
+    return stale_groups, up_to_date, shared_jobs
+
+def chunk_shared_jobs(shared_jobs):
+    return [shared_jobs[start:start + SHARED_CHUNK_SIZE] for start in range(0, len(shared_jobs), SHARED_CHUNK_SIZE)]
+
+def build_shared_textures(build_config, shared_jobs, context):
+    """Produce shared textures into the texture cache, where the target groups pick them up as cache hits."""
+    source_index = get_source_index(build_config['source_dir'])
+    texture_options = context['texture_options']
+    batch_queue = {} if texture_options.get('batch_resize', True) else None
+    # Duplicates share the texture cache entry of their content, the groups find it without it being produced twice
+    dedup = ContentDedup(context['source_hashes']) if texture_options.get('dedup_sources', True) else None
+    scratch_trees = {}
+
+    for job in shared_jobs:
+        levels = [{'scale_factor': scale_factor, 'tree': scratch_trees.setdefault(scale_factor, MemoryTree(context['png_encoder'])), 'variables': {}} for scale_factor in job['scale_factors']]
+        process_file(source_index, levels, job['original_path'], job['uid_info'], context['texture_cache'], texture_options, batch_queue, dedup, context['source_hashes'])
+
+    if batch_queue:
+        process_texture_batches(batch_queue, context['texture_cache'])
+    return len(shared_jobs)
+
+def collect_build_targets(build_config, pack_variables):
+    """List every (platform, version, resolution) target with the pack variables it should be built with."""
     mappings_dir = build_config['mappings_dir']
-    output_dir = build_config['output_dir']
-    tempfile_dir = build_config['tempfile_dir']
-    log_output_dir = build_config['log_output_dir']
-    source_mapping_file = build_config['source_mapping_file']
-    version_mappings_file = build_config['version_mappings_file']
-    pack_config_file = build_config['pack_config_file']
-
-    #Load pack config for using as variables
-    pack_variables = load_yml_config(pack_config_file)
+    version_to_pack_format_data = load_version_to_pack_format(build_config['version_mappings_file'])
 
     #Add a few variables to the list
     pack_name = pack_variables["name"]
     pack_version_number = f"{pack_variables['pack_version_number'][0]}.{pack_variables['pack_version_number'][1]}.{pack_variables['pack_version_number'][2]}"
 
     resolutions = pack_variables['resolutions']
+    targets = []
 
-    #Configure logging
-    setup_logging(log_output_dir)
-    logging.info("Starting the resource pack generator...")
-
-    version_to_pack_format_data = load_version_to_pack_format(version_mappings_file)
-    
     for platform, versions in version_to_pack_format_data.items():
         platform_mappings_dir = os.path.join(mappings_dir, platform)
 
         for version, version_info in versions.items():
-            pack_variables["pack_format"] = version_info["pack_format"]
-            #print(f"Pack_Format: {pack_variables['pack_format']}")
             zip_extension = version_info.get("zip_extension", ".zip")
 
             skip_build = version_info.get("skip_build")
@@ -356,41 +850,234 @@ def main(config_path):
                 continue
 
             if os.path.exists(os.path.join(platform_mappings_dir, version)):
-                platform_mappings_dir = os.path.join(mappings_dir, platform)
-                pack_variables["version"] = format_pack_version_number(version)
-
                 for scale_key, scale_name in resolutions.items():
-                    pack_variables["resolution"] = scale_name
                     scale_key = int(scale_key)
-                    scale_factor = 0.5 ** scale_key if scale_key > 0 else 1
-                    version_dir = os.path.join(tempfile_dir, f"{platform}_{version}_{scale_name}")
-
-                    uid_mappings = load_uid_mappings(source_mapping_file, version)
-
-                    mappings = load_mappings(version, platform_mappings_dir)
-                    resolution_dir = os.path.join(tempfile_dir, f"{source_dir}_{platform}_{version}_{scale_name}")
-
-                    resolution_adjustments(source_dir, resolution_dir, mappings, uid_mappings, scale_factor, pack_variables)
-                    apply_mappings(resolution_dir, version_dir, mappings, uid_mappings)
-
-                    # Update pack.mcmeta and create zip file for each version
-                    zip_file_name = f"[{platform}][{version}][{scale_name}]{pack_name}_{pack_version_number}{zip_extension}"
-                    create_zip_from_folder(version_dir, os.path.join(output_dir, zip_file_name))
-                    logging.warning(f"Created zip file: {os.path.join(output_dir, zip_file_name)}")
-                    
-                    # Remove the folder after creating the zip file
-                    shutil.rmtree(resolution_dir)
-                    shutil.rmtree(version_dir)
-        
+
+                    target_variables = dict(pack_variables)
+                    target_variables["pack_format"] = version_info["pack_format"]
+                    target_variables["version"] = format_pack_version_number(version)
+                    target_variables["resolution"] = scale_name
+
+                    targets.append(({
+                        'platform': platform,
+                        'version': version,
+                        'scale_name': scale_name,
+                        'scale_factor': 0.5 ** scale_key if scale_key > 0 else 1,
+                        'platform_mappings_dir': platform_mappings_dir,
+                        'zip_file_name': f"[{platform}][{version}][{scale_name}]{pack_name}_{pack_version_number}{zip_extension}",
+                    }, target_variables))
+
             else:
                 logging.warning(f"Warning: {version} version for {platform} platform could not be found in {mappings_dir} Mapping Directory so it could not be created.")
                 print(f"Warning: {version} version for {platform} platform could not be found in {mappings_dir} Mapping Directory so it could not be created.")
 
+    return targets
+
+def init_worker_logging(log_queue):
+    """Send every log record of a pool worker through the queue owned by the main process."""
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root_logger.setLevel(logging.INFO)
+
+def init_worker(log_queue, memory_budget, worker_peak):
+    """Set up a pool worker: log through the main process, reserve memory from the budget shared by all workers and
+    record the worker's peak memory."""
+    init_worker_logging(log_queue)
+    set_memory_budget(memory_budget)
+    set_worker_peak_memory(worker_peak)
+
+def run_worker_job(job, *args):
+    """Run a build job in a pool worker and record the worker's peak memory once it's done."""
+    try:
+        return job(*args)
+    finally:
+        note_worker_peak()
+
+def run_targets_in_pool(build_config, target_groups, jobs, context, shared_jobs=()):
+    """Build the shared textures and then the target groups on a process pool, returns the list of targets that failed."""
+    failed = []
+
+    # Only the main process writes the log file, workers hand their records over a queue
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    listener.start()
+
+    worker_peak = WorkerPeakMemory()
+    set_worker_peak_memory(worker_peak)
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(log_queue, get_memory_budget(), worker_peak)) as executor:
+            # Chunks are submitted most expensive first, every group waits for the shared textures it reads
+            shared_futures = [executor.submit(run_worker_job, build_shared_textures, build_config, chunk, context) for chunk in chunk_shared_jobs(shared_jobs)]
+            for future in concurrent.futures.as_completed(shared_futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    # The groups still produce the textures themselves, only the sharing is lost
+                    logging.error(f"Shared texture job failed: {e!r}")
+
+            futures = {executor.submit(run_worker_job, build_targets, build_config, group, context): group for group in target_groups}
+            for future in concurrent.futures.as_completed(futures):
+                group = futures[future]
+                try:
+                    future.result()
+                    for target, target_variables in group:
+                        print(f"Built: {target['zip_file_name']}")
+                except Exception as e:
+                    for target, target_variables in group:
+                        logging.error(f"Build failed for {target['zip_file_name']}: {e!r}")
+                        print(f"Build failed for {target['zip_file_name']}: {e!r}")
+                        failed.append(target)
+    finally:
+        listener.stop()
+
+    return failed
+
+def get_build_mapping_store(build_config):
+    """Return the mapping store for the build config, compiled tables are kept in mapping_store_dir."""
+    store_dir = build_config.get('mapping_store_dir', os.path.join(build_config['output_dir'], '_cache', 'mappings'))
+    return get_mapping_store(build_config['source_mapping_file'], build_config['mappings_dir'], store_dir)
+
+def create_texture_cache(build_config):
+    """Create the persistent texture cache configured in the build config."""
+    cache_dir = build_config.get('texture_cache_dir', os.path.join(build_config['output_dir'], '_cache', 'textures'))
+    max_size_mb = build_config.get('texture_cache_size_mb', 2048)
+    return TextureCache(cache_dir, max_size_mb)
+
+def create_encoded_cache(build_config):
+    """Create the persistent cache of encoded PNGs configured in the build config."""
+    cache_dir = build_config.get('encoded_cache_dir', os.path.join(build_config['output_dir'], '_cache', 'encoded'))
+    max_size_mb = build_config.get('encoded_cache_size_mb', 1024)
+    return TextureCache(cache_dir, max_size_mb)
+
+def main(config_path, jobs=1, use_cache=True, force=False, debug_temp=False, bleed_mode=None, memory_budget_mb=None, png_profile=None, alpha_mode=None, resample_filter=None):
+    build_config = load_yml_config(config_path)
+
+    log_output_dir = build_config['log_output_dir']
+    pack_config_file = build_config['pack_config_file']
+
+    #Load pack config for using as variables
+    pack_variables = load_yml_config(pack_config_file)
+
+    #Configure logging
+    setup_logging(log_output_dir)
+    logging.info("Starting the resource pack generator...")
+
+    targets = collect_build_targets(build_config, pack_variables)
+    # List the source tree once, existence checks and override lookups of every target are answered from it
+    source_index = get_source_index(build_config['source_dir'])
+    source_index.forget_stats()
+    seed_fallbacks(source_index, get_build_mapping_store(build_config), targets)
+    texture_cache = create_texture_cache(build_config) if use_cache else None
+    encoded_cache = create_encoded_cache(build_config) if use_cache else None
+    png_profile = png_profile or build_config.get('png_profile', 'release')
+
+    # Texture and atlas jobs of every worker reserve their decoded pixels from one budget, 0 leaves memory unlimited
+    memory_budget_mb = build_config.get('memory_budget_mb', 0) if memory_budget_mb is None else memory_budget_mb
+    memory_budget = MemoryBudget(memory_budget_mb)
+    set_memory_budget(memory_budget)
+    atlas_image_cache_mb = build_config.get('atlas_image_cache_mb', 256)
+    if memory_budget_mb:
+        # The atlas image caches live outside the reservations, together they may hold a quarter of the budget
+        atlas_image_cache_mb = min(atlas_image_cache_mb, memory_budget_mb / 4 / jobs)
+
+    # Hash the source tree once, every target compares its inputs against its last build manifest
+    manifest_dir = build_config.get('manifest_dir', os.path.join(build_config['output_dir'], '_manifests'))
+    source_hashes, resolution_overrides = hash_source_tree(source_index, os.path.join(manifest_dir, '_source_hashes.json'))
+
+    context = {
+        'texture_cache': texture_cache,
+        'manifest_dir': manifest_dir,
+        'source_hashes': source_hashes,
+        'resolution_overrides': resolution_overrides,
+        'builder_hash': hash_builder_scripts(),
+        'force': force,
+        'debug_temp': debug_temp,
+        'atlas_image_cache_mb': atlas_image_cache_mb,
+        'atlas_backend': build_config.get('atlas_backend', 'numpy'),
+        'zip_options': get_zip_options(build_config),
+        'png_encoder': PngEncoder(png_profile, encoded_cache, build_config.get('reduce_colors', True)),
+        'texture_options': {
+            'bleed_mode': bleed_mode or build_config.get('bleed_mode', 'nearest'),
+            'batch_resize': build_config.get('batch_resize', True),
+            'pyramid_mode': build_config.get('pyramid_mode', 'DIRECT').upper(),
+            'alpha_mode': (alpha_mode or build_config.get('alpha_mode', 'SEPARATE')).upper(),
+            'resample_filter': (resample_filter or build_config.get('resample_filter', 'LANCZOS')).upper(),
+            'png_profile': png_profile,
+            'reduce_colors': build_config.get('reduce_colors', True),
+            'dedup_sources': build_config.get('dedup_sources', True),
+        },
+    }
+    failed = []
+
+    # Resolutions of the same version share one decode of every source texture
+    target_groups = group_build_targets(targets, build_config.get('resolution_pyramid', True))
+    target_groups, up_to_date, shared_jobs = plan_build(build_config, target_groups, context)
+    for target in up_to_date:
+        print(f"Up to date: {target['zip_file_name']}")
+
+    # Shared textures are handed to the target groups through the texture cache, without one a cache for this run is used
+    run_cache_dir = None
+    if shared_jobs and not texture_cache:
+        os.makedirs(build_config['tempfile_dir'], exist_ok=True)
+        run_cache_dir = tempfile.mkdtemp(prefix="shared_textures_", dir=build_config['tempfile_dir'])
+        context['texture_cache'] = TextureCache(run_cache_dir)
+
+    use_pool = jobs > 1 and len(target_groups) > 1
+    try:
+        if use_pool:
+            print(f"Building {sum(len(group) for group in target_groups)} targets in {len(target_groups)} groups with {jobs} jobs")
+            failed = run_targets_in_pool(build_config, target_groups, jobs, context, shared_jobs)
+        else:
+            for chunk in chunk_shared_jobs(shared_jobs):
+                try:
+                    build_shared_textures(build_config, chunk, context)
+                except Exception:
+                    # The groups still produce the textures themselves, only the sharing is lost
+                    logging.exception("Shared texture job failed")
+
+            for group in target_groups:
+                try:
+                    build_targets(build_config, group, context)
+                except Exception as e:
+                    for target, target_variables in group:
+                        logging.exception(f"Build failed for {target['zip_file_name']}")
+                        print(f"Build failed for {target['zip_file_name']}: {e!r}")
+                        failed.append(target)
+    finally:
+        if run_cache_dir:
+            shutil.rmtree(run_cache_dir, ignore_errors=True)
+
+    if texture_cache:
+        texture_cache.evict()
+    if encoded_cache:
+        encoded_cache.evict()
+
+    report_peak_memory(memory_budget, workers=use_pool)
+
+    if failed:
+        print(f"Build process finished with {len(failed)} failed target(s):")
+        for target in failed:
+            print(f"  {target['zip_file_name']}")
+        return 1
+
     print(f"Build process complete!")
+    return 0
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Resource Pack Generator')
     parser.add_argument('config', help='Path to the build configuration file')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of (platform, version) target groups to build in parallel')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the persistent texture cache')
+    parser.add_argument('--force', action='store_true', help='Rebuild every target even if its build manifest is up to date')
+    parser.add_argument('--debug-temp', action='store_true', help='Write intermediate files to tempfile_dir and keep them instead of streaming the zip from memory')
+    parser.add_argument('--bleed-mode', choices=sorted(BLEED_MODES), help='Alpha bleed used before downsampling, overrides bleed_mode from the build config')
+    parser.add_argument('--alpha-mode', type=str.upper, choices=ALPHA_MODES, help='How the alpha of RGBA textures is resampled, SEPARATE with alpha bleed or premultiplied CUTOUT or SMOOTH, overrides alpha_mode from the build config')
+    parser.add_argument('--resample-filter', type=str.upper, choices=RESAMPLE_FILTERS, help='Filter textures are downsampled with, BOX and NEAREST for pixel art, overrides resample_filter from the build config')
+    parser.add_argument('--png-profile', choices=sorted(PNG_PROFILES), help='PNG encoder profile, draft for quick local builds and release for shipped packs, overrides png_profile from the build config')
+    parser.add_argument('--memory-budget-mb', type=int, help='Most MB of decoded pixels texture and atlas jobs may hold at once, 0 for no limit, overrides memory_budget_mb from the build config')
     args = parser.parse_args()
     
-    main(args.config)
+    sys.exit(main(args.config, jobs=max(1, args.jobs), use_cache=not args.no_cache, force=args.force, debug_temp=args.debug_temp, bleed_mode=args.bleed_mode,
+                  memory_budget_mb=args.memory_budget_mb, png_profile=args.png_profile, alpha_mode=args.alpha_mode,
+                  resample_filter=args.resample_filter))
@@ -0,0 +1,113 @@
+import os
+import json
+import glob
+import hashlib
+import logging
+from source_index import path_key
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(file_path):
+    """Return the sha256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_value(value):
+    """Return the sha256 digest of any JSON serializable value."""
+    return hash_bytes(json.dumps(value, sort_keys=True, default=str).encode('utf-8'))
+
+def hash_builder_scripts():
+    """Fingerprint the build scripts so a builder update invalidates every manifest."""
+    digest = hashlib.sha256()
+    for script_path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+        with open(script_path, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def hash_source_tree(source_index, hash_cache_file):
+    """Hash every file of a SourceIndex, returns {relative path: hash} and the resolution overrides per base path key.
+
+    Hashes are remembered in hash_cache_file by size and mtime, so only new or modified files are read again.
+    """
+    try:
+        with open(hash_cache_file, 'r') as file:
+            hash_cache = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        hash_cache = {}
+
+    source_hashes = {}
+    new_hash_cache = {}
+
+    for relative_path in source_index.paths():
+        file_path = source_index.path(relative_path)
+        # Stat'ed through the index, the build's image header lookups reuse these stats
+        stat = source_index.stat(relative_path)
+        if stat is None:
+            # Listed but gone by now, or a dangling symlink, the build treats it as missing too
+            logging.warning(f"Warning: Could not stat source file {file_path}, not hashed")
+            continue
+        mtime_ns, size = stat
+
+        cached = hash_cache.get(relative_path)
+        if cached and cached[0] == size and cached[1] == mtime_ns:
+            file_hash = cached[2]
+        else:
+            file_hash = hash_file(file_path)
+
+        new_hash_cache[relative_path] = [size, mtime_ns, file_hash]
+        source_hashes[relative_path] = file_hash
+
+    os.makedirs(os.path.dirname(hash_cache_file), exist_ok=True)
+    with open(hash_cache_file, 'w') as file:
+        json.dump(new_hash_cache, file)
+
+    # The index already matched every _<N>px override to its base path
+    resolution_overrides = {base_key: [overrides[height] for height in sorted(overrides)] for base_key, overrides in source_index.overrides.items()}
+    return source_hashes, resolution_overrides
+
+class BuildManifest:
+    """Record of every input that contributed to a build target, used to skip targets whose inputs did not change."""
+
+    def __init__(self):
+        self.inputs = {}
+
+    def add(self, key, value_hash):
+        self.inputs[key] = value_hash
+
+    def add_value(self, key, value):
+        self.inputs[key] = hash_value(value)
+
+    def add_file(self, key, file_path):
+        self.inputs[key] = hash_file(file_path) if os.path.exists(file_path) else None
+
+    def add_source_texture(self, path, source_hashes, resolution_overrides):
+        """Add a texture from the source tree together with all of its _<N>px resolution overrides."""
+        path = path.replace(os.sep, '/')
+        self.inputs[f"source:{path}"] = source_hashes.get(path)
+        for override_path in resolution_overrides.get(path_key(path), []):
+            self.inputs[f"source:{override_path}"] = source_hashes.get(override_path)
+
+    def digest(self):
+        return hash_value(self.inputs)
+
+    def save(self, manifest_path):
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path, 'w') as file:
+            json.dump({'digest': self.digest(), 'inputs': self.inputs}, file, indent=2, sort_keys=True)
+
+    def matches(self, manifest_path):
+        """Check if the manifest saved at manifest_path was built from the same inputs."""
+        try:
+            with open(manifest_path, 'r') as file:
+                saved_manifest = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        except OSError as e:
+            logging.warning(f"Warning: Could not read build manifest {manifest_path}: {e}")
+            return False
+
+        return saved_manifest.get('digest') == self.digest()
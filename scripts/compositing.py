@@ -0,0 +1,57 @@
+import numpy as np
+
+def div255(values):
+    """Divide by 255 with rounding the way Pillow's paste does, for uint32 arrays."""
+    values = values + 128
+    return ((values >> 8) + values) >> 8
+
+def crop_array(array, box, padding=0):
+    """Crop a H x W x C array like Image.crop: the box is rounded and areas outside the array are filled with padding.
+
+    Returns a view when the box lies within the array.
+    """
+    x0, y0, x1, y1 = map(int, map(round, box))
+    height, width = array.shape[:2]
+    if 0 <= x0 <= x1 <= width and 0 <= y0 <= y1 <= height:
+        return array[y0:y1, x0:x1]
+
+    cropped = np.empty((max(y1 - y0, 0), max(x1 - x0, 0), array.shape[2]), array.dtype)
+    cropped[:] = padding
+    src_x0, src_y0 = max(x0, 0), max(y0, 0)
+    src_x1, src_y1 = min(x1, width), min(y1, height)
+    if src_x0 < src_x1 and src_y0 < src_y1:
+        cropped[src_y0 - y0:src_y1 - y0, src_x0 - x0:src_x1 - x0] = array[src_y0:src_y1, src_x0:src_x1]
+    return cropped
+
+def clip_blit(canvas, stamp, position):
+    """Return the canvas region and the part of the stamp that overlap when the stamp is placed at position."""
+    x, y = position
+    height, width = stamp.shape[:2]
+    canvas_height, canvas_width = canvas.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, canvas_width), min(y + height, canvas_height)
+    if x0 >= x1 or y0 >= y1:
+        return None, None
+    return canvas[y0:y1, x0:x1], stamp[y0 - y:y1 - y, x0 - x:x1 - x]
+
+def paste_over(canvas, stamp, position):
+    """Blend an RGBA stamp into an RGBA canvas in place, using the stamp's alpha as the mask.
+
+    Matches Image.paste(stamp, position, stamp) exactly: every channel, alpha included, is mixed by the mask.
+    """
+    region, stamp = clip_blit(canvas, stamp, position)
+    if region is None:
+        return
+    mask = stamp[..., 3:4].astype(np.uint32)
+    region[:] = div255(region * (255 - mask) + stamp * mask)
+
+def alpha_add_lut(alpha_add):
+    """Lookup table scaling an alpha value by alpha_add, truncated and clipped like Image.point does."""
+    return np.clip([int(p * alpha_add) for p in range(256)], 0, 255).astype(np.uint8)
+
+def add_alpha(alpha_channel, addition, alpha_add):
+    """Add an alpha channel scaled by alpha_add to alpha_channel, saturating at 255 like ImageChops.add."""
+    scaled = alpha_add_lut(alpha_add)[addition]
+    if alpha_channel is None:
+        return scaled
+    return np.minimum(alpha_channel.astype(np.uint16) + scaled, 255).astype(np.uint8)
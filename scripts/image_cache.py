@@ -0,0 +1,78 @@
+import logging
+import numpy as np
+from collections import OrderedDict
+
+def item_size_bytes(item):
+    if isinstance(item, tuple):
+        return sum(item_size_bytes(part) for part in item)
+    if isinstance(item, np.ndarray):
+        return item.nbytes
+    return item.width * item.height * len(item.getbands())
+
+def decode_array(tree, relative_path):
+    """Decode a file of a pack tree to a read only RGBA array, together with the RGBA value of the pixels Image.crop
+    pads it with outside its bounds. The padding depends on the file's mode, a crop of an RGB image is opaque black.
+    """
+    with tree.open_image(relative_path) as img:
+        array = np.asarray(img if img.mode == 'RGBA' else img.convert('RGBA'))
+        padding = np.asarray(img.crop((-1, -1, 0, 0)).convert('RGBA'))[0, 0]
+    array.flags.writeable = False
+    return array, padding
+
+class DecodedImageCache:
+    """Least recently used cache of decoded images and pixel arrays, bounded by the memory their pixels take.
+
+    Shared by the atlas compiles of a build target so a source stamped into several atlases, or several times
+    into one, is decoded once. Cached images are shared and must not be modified by callers.
+    """
+
+    def __init__(self, max_size_mb=256):
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.items = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def open(self, tree, relative_path):
+        """Return the decoded image for a file of a pack tree, decoding it only if it isn't cached."""
+        def decode():
+            # Loading releases the file Pillow opened, the decoded image stays usable without a copy
+            img = tree.open_image(relative_path)
+            img.load()
+            return img
+        return self._lookup((id(tree), relative_path), decode)
+
+    def open_array(self, tree, relative_path):
+        """Return a file of a pack tree as a read only H x W x 4 RGBA array and its padding, decoding it only if it
+        isn't cached. See decode_array.
+        """
+        return self._lookup((id(tree), relative_path, 'array'), lambda: decode_array(tree, relative_path))
+
+    def _lookup(self, key, decode):
+        item = self.items.get(key)
+        if item is not None:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item
+
+        self.misses += 1
+        item = decode()
+
+        item_size = item_size_bytes(item)
+        if item_size <= self.max_size:
+            self.items[key] = item
+            self.size += item_size
+            while self.size > self.max_size:
+                _, evicted_item = self.items.popitem(last=False)
+                self.size -= item_size_bytes(evicted_item)
+                self.evictions += 1
+        return item
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def log_stats(self, label):
+        logging.warning(f"Atlas image cache for {label}: {self.hits} hits, {self.misses} decodes, {self.hit_rate():.0%} hit rate, "
+                        f"{self.evictions} evicted, {self.size // (1024 * 1024)} MB held")
@@ -0,0 +1,108 @@
+import os
+import struct
+from collections import namedtuple
+from PIL import Image
+
+ImageInfo = namedtuple('ImageInfo', ['width', 'height', 'mode', 'has_alpha'])
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLOR_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+TGA_HEADER_SIZE = 18
+
+def read_png_header(file):
+    """Read size, mode and alpha presence from the IHDR and tRNS chunks of a PNG, without decoding pixels."""
+    if file.read(8) != PNG_SIGNATURE:
+        return None
+
+    length, chunk_type = struct.unpack('>I4s', file.read(8))
+    if chunk_type != b'IHDR':
+        return None
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', file.read(10))
+    file.seek(length - 10 + 4, os.SEEK_CUR)
+
+    mode = PNG_COLOR_MODES.get(color_type, 'RGBA')
+    if color_type == 0 and bit_depth == 1:
+        mode = '1'
+    elif color_type == 0 and bit_depth == 16:
+        mode = 'I;16'
+    has_alpha = color_type in (4, 6)
+
+    # A tRNS chunk before the image data adds transparency to gray, RGB and palette images
+    while not has_alpha:
+        chunk_header = file.read(8)
+        if len(chunk_header) < 8:
+            break
+        length, chunk_type = struct.unpack('>I4s', chunk_header)
+        if chunk_type in (b'IDAT', b'IEND'):
+            break
+        if chunk_type == b'tRNS':
+            has_alpha = True
+        file.seek(length + 4, os.SEEK_CUR)
+
+    return ImageInfo(width, height, mode, has_alpha)
+
+def read_tga_header(file):
+    """Read size, mode and alpha presence from the 18 byte TGA header."""
+    header = file.read(TGA_HEADER_SIZE)
+    if len(header) < TGA_HEADER_SIZE:
+        return None
+
+    image_type = header[2]
+    width, height, pixel_depth, descriptor = struct.unpack('<HHBB', header[12:18])
+    alpha_bits = descriptor & 0x0F
+
+    if image_type in (1, 9):
+        mode = 'P'
+    elif image_type in (3, 11):
+        mode = 'LA' if pixel_depth == 16 else 'L'
+    else:
+        mode = 'RGBA' if pixel_depth == 32 or alpha_bits else 'RGB'
+
+    return ImageInfo(width, height, mode, mode in ('LA', 'RGBA'))
+
+def read_image_header(file, name=''):
+    """Read image metadata from an open binary file, falling back to Pillow's lazy open for other formats."""
+    if name.lower().endswith('.tga'):
+        info = read_tga_header(file)
+    else:
+        info = read_png_header(file)
+
+    if info is None:
+        file.seek(0)
+        with Image.open(file) as img:
+            info = ImageInfo(img.width, img.height, img.mode, img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info)
+    return info
+
+class ImageIndex:
+    """Image metadata per file path, read from file headers only and refreshed when a file's mtime or size changes."""
+
+    def __init__(self):
+        self.entries = {}
+        self.header_reads = 0
+
+    def get(self, file_path, signature=None):
+        """Return the ImageInfo for a file, or None if it does not exist.
+
+        signature is the file's (mtime_ns, size) if the caller already knows it, like SourceIndex.stat does for
+        source files, otherwise the file is stat'ed.
+        """
+        if signature is None:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                return None
+            signature = (stat.st_mtime_ns, stat.st_size)
+
+        key = os.path.normcase(os.path.abspath(file_path))
+        entry = self.entries.get(key)
+        if entry and entry[0] == signature:
+            return entry[1]
+
+        with open(file_path, 'rb') as file:
+            info = read_image_header(file, file_path)
+        self.header_reads += 1
+        self.entries[key] = (signature, info)
+        return info
+
+# Shared by the builder, the atlas handler and the pack importer within a process
+image_index = ImageIndex()
@@ -0,0 +1,179 @@
+import os
+import json
+import logging
+from atomic_file import atomic_write
+from build_manifest import hash_file
+
+def parse_version(version_str):
+    return tuple(map(int, version_str.split('.')))
+
+def resolve_uid_mapping(data, current_version_tuple):
+    """Apply the version overrides of one UID entry, an override for a version also applies to every lower version."""
+    version_specific_data = data.get("versions", {})
+    merged_data = data.copy()  # Start with default data
+
+    # Iterate through versions in ascending order and apply overrides
+    for version in sorted(version_specific_data.keys(), key=parse_version):
+        if current_version_tuple <= parse_version(version):
+            merged_data.update(version_specific_data[version])
+
+    return merged_data
+
+def mapping_uids(mapping):
+    """List the UIDs a version mapping entry reads from."""
+    if mapping.get('type') == 'grid':
+        return list(mapping['source'])
+    elif mapping.get('type') in ['stamp', 'tga']:
+        return [atlas_mapping['uid'] for atlas_mapping in mapping['source']]
+    return [mapping['source']]
+
+def read_category_files(version_dir):
+    """Read the mapping entries of every category file in a version folder."""
+    mappings = []
+    for category_file in os.listdir(version_dir):
+        if category_file.endswith('.json'):
+            with open(os.path.join(version_dir, category_file), 'r') as file:
+                mappings.extend(json.load(file))
+        else:
+            logging.warning(f"Warning: Ignoring non-JSON file: {category_file}")
+    return mappings
+
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+class MappingStore:
+    """Resolved mapping tables per (platform, version), compiled once from the source mapping and the category files.
+
+    A table holds the mapping entries of every category file of a version and the UID entries they use, with the
+    version overrides applied. Tables are compiled on first use and, with a store_dir, saved as
+    `<store_dir>/<platform>/<version>.json` so later runs and pool workers load them instead of compiling again.
+    Every table records the size, mtime and hash of its input files and is recompiled once the content of one
+    of them changes.
+    """
+
+    def __init__(self, uid_mapping_file, mappings_dir, store_dir=None):
+        self.uid_mapping_file = uid_mapping_file
+        self.mappings_dir = mappings_dir
+        self.store_dir = store_dir
+        self.tables = {}
+        self.source = None
+        self.compiles = 0
+
+    def source_mapping(self):
+        """Return the unresolved source mapping, reread only when the file changes. The result must not be modified."""
+        signature = file_signature(self.uid_mapping_file)
+        if self.source is None or self.source[0] != signature:
+            with open(self.uid_mapping_file, 'r') as file:
+                self.source = (signature, json.load(file))
+        return self.source[1]
+
+    def uid_mappings(self, platform, version):
+        """Return the UID entries used by a version's mappings, with the version overrides applied."""
+        return self.table(platform, version)['uid_mappings']
+
+    def mappings(self, platform, version):
+        """Return the mapping entries of every category file of a version."""
+        return self.table(platform, version)['mappings']
+
+    def table(self, platform, version):
+        key = (platform, version)
+        input_files = self._input_files(platform, version)
+
+        table = self.tables.get(key) or self._load(platform, version)
+        if table is not None:
+            matches, refreshed = self._check_inputs(table['inputs'], input_files)
+            if matches:
+                if refreshed:
+                    self._save(platform, version, table)
+                self.tables[key] = table
+                return table
+
+        table = self._compile(platform, version, input_files)
+        self.tables[key] = table
+        self._save(platform, version, table)
+        return table
+
+    def _version_dir(self, platform, version):
+        return os.path.join(self.mappings_dir, platform, version)
+
+    def _input_files(self, platform, version):
+        version_dir = self._version_dir(platform, version)
+        input_files = [self.uid_mapping_file]
+        if os.path.isdir(version_dir):
+            input_files.extend(os.path.join(version_dir, category_file) for category_file in os.listdir(version_dir) if category_file.endswith('.json'))
+        return input_files
+
+    def _check_inputs(self, inputs, input_files):
+        """Compare recorded inputs with the files, by size and mtime and by content hash for files whose stat changed.
+
+        Returns whether the table is still valid and whether the recorded stats were refreshed.
+        """
+        if set(inputs) != set(input_files):
+            return False, False
+
+        refreshed = False
+        for file_path in input_files:
+            signature = file_signature(file_path)
+            if inputs[file_path][:2] == signature:
+                continue
+            file_hash = hash_file(file_path)
+            if file_hash != inputs[file_path][2]:
+                return False, False
+            inputs[file_path] = [*signature, file_hash]
+            refreshed = True
+        return True, refreshed
+
+    def _compile(self, platform, version, input_files):
+        version_dir = self._version_dir(platform, version)
+        logging.warning(f"Compiling mappings from: {version_dir}")
+        inputs = {file_path: [*file_signature(file_path), hash_file(file_path)] for file_path in input_files}
+
+        mappings = []
+        if os.path.exists(version_dir):
+            mappings = read_category_files(version_dir)
+        else:
+            logging.warning(f"Warning: No mappings found for version {version}")
+
+        all_uid_mappings = self.source_mapping()
+        current_version_tuple = parse_version(version)
+        uid_mappings = {}
+        for mapping in mappings:
+            for uid in mapping_uids(mapping):
+                if uid in all_uid_mappings and uid not in uid_mappings:
+                    uid_mappings[uid] = resolve_uid_mapping(all_uid_mappings[uid], current_version_tuple)
+
+        self.compiles += 1
+        return {'inputs': inputs, 'uid_mappings': uid_mappings, 'mappings': mappings}
+
+    def _table_path(self, platform, version):
+        return os.path.join(self.store_dir, platform, f"{version}.json")
+
+    def _load(self, platform, version):
+        if not self.store_dir:
+            return None
+        try:
+            with open(self._table_path(platform, version), 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save(self, platform, version, table):
+        """Write a compiled table, atomically so concurrent builds can share a store."""
+        if not self.store_dir:
+            return
+        table_path = self._table_path(platform, version)
+        try:
+            atomic_write(table_path, json.dumps(table).encode('utf-8'))
+        except OSError as e:
+            logging.warning(f"Warning: Could not save compiled mappings {table_path}: {e}")
+
+# One store per set of inputs within a process, shared by the builder, the importer and the GUI
+mapping_stores = {}
+
+def get_mapping_store(uid_mapping_file, mappings_dir, store_dir=None):
+    """Return the process wide store for a source mapping file and mappings folder."""
+    key = (os.path.abspath(uid_mapping_file), os.path.abspath(mappings_dir), store_dir and os.path.abspath(store_dir))
+    if key not in mapping_stores:
+        mapping_stores[key] = MappingStore(uid_mapping_file, mappings_dir, store_dir)
+    return mapping_stores[key]
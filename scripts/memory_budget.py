@@ -0,0 +1,185 @@
+import sys
+import logging
+import contextlib
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in ('PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                                                 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+
+    kernel32 = ctypes.WinDLL('kernel32')
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    psapi = ctypes.WinDLL('psapi')
+    psapi.GetProcessMemoryInfo.argtypes = (wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD)
+    psapi.GetProcessMemoryInfo.restype = wintypes.BOOL
+
+MB = 1024 * 1024
+
+# Rough bytes a job holds at its peak per pixel it works on, used to reserve memory from image headers before decoding
+TEXTURE_BYTES_PER_PIXEL = {
+    # Decoded source, bled copy, split channels and the merged RGB
+    'pillow': 16,
+    # Decoded stack, bleed mosaic and distance transform, float64 resample passes
+    'batch': 64,
+    # Decoded source, bled copy and distance transform, the resample passes only hold one tile
+    'tiled': 24,
+}
+# Canvas and, for the largest source, its decoded image and cropped or transposed stamp
+ATLAS_BYTES_PER_PIXEL = 8
+
+# Fields of the shared stats array
+USED, PEAK, WAITS, OVERSIZED = range(4)
+
+def texture_footprint(width, height, path='batch', tile_size=0):
+    """Estimated peak bytes of downsampling one texture of the size its header gives, plus the float64 RGB tiles of the tiled path."""
+    return width * height * TEXTURE_BYTES_PER_PIXEL[path] + tile_size * tile_size * 3 * 8 * 2
+
+def atlas_footprint(canvas_size, largest_source_pixels):
+    """Estimated peak bytes of compiling one atlas, from its canvas size and the headers of its sources."""
+    return (canvas_size[0] * canvas_size[1] + largest_source_pixels) * ATLAS_BYTES_PER_PIXEL
+
+class MemoryBudget:
+    """Bytes the texture and atlas jobs of a build may hold at once, shared with the pool workers.
+
+    Jobs reserve their footprint, estimated from image headers, before they decode anything and wait while the
+    reservation would take the budget over its limit. A job larger than the whole budget waits until it can hold the
+    whole budget and runs alone, callers switch to a tiled path for it where there is one. Without a limit
+    reservations never wait.
+    """
+
+    def __init__(self, limit_mb=None):
+        self.limit = int(limit_mb * MB) if limit_mb else None
+        self.condition = self.stats = None
+        if self.limit:
+            self.condition = multiprocessing.Condition()
+            # Used, peak, waits and oversized jobs, guarded by the condition
+            self.stats = multiprocessing.RawArray('q', 4)
+
+    def fits(self, nbytes):
+        return self.limit is None or nbytes <= self.limit
+
+    def note_oversized(self, label):
+        with self.condition:
+            self.stats[OVERSIZED] += 1
+        logging.warning(f"{label} needs more than the memory budget of {self.limit // MB} MB, using the bounded memory path")
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes, label=''):
+        """Hold nbytes of the budget for the duration of the with block, waiting until they are available.
+
+        Reservations must not be nested, a job waiting for more budget while holding some could wait forever.
+        """
+        if self.limit is None:
+            yield
+            return
+
+        nbytes = min(int(nbytes), self.limit)
+        with self.condition:
+            if self.stats[USED] + nbytes > self.limit:
+                self.stats[WAITS] += 1
+                logging.info(f"Waiting for {nbytes // MB} MB of the memory budget: {label}")
+                self.condition.wait_for(lambda: self.stats[USED] + nbytes <= self.limit)
+            self.stats[USED] += nbytes
+            self.stats[PEAK] = max(self.stats[PEAK], self.stats[USED])
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.stats[USED] -= nbytes
+                self.condition.notify_all()
+
+    def report(self):
+        if self.limit is None:
+            return None
+        return (f"Memory budget: {self.stats[PEAK] // MB} of {self.limit // MB} MB reserved at the peak, "
+                f"{self.stats[WAITS]} jobs waited, {self.stats[OVERSIZED]} exceeded the budget")
+
+# The budget of this process, set by the build and inherited by pool workers through their initializer
+current_budget = MemoryBudget()
+
+def set_memory_budget(budget):
+    global current_budget
+    current_budget = budget
+
+def get_memory_budget():
+    return current_budget
+
+def peak_working_set():
+    """Peak working set in bytes of this process on Windows, None if it can't be queried."""
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+def peak_rss_bytes():
+    """Peak resident set size in bytes of this process, None where unavailable."""
+    if resource is not None:
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        unit = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    if sys.platform == 'win32':
+        return peak_working_set()
+    return None
+
+class WorkerPeakMemory:
+    """Largest peak resident set size of the pool workers, each worker records its own after every job.
+
+    Windows has no RUSAGE_CHILDREN to report the peak of finished child processes.
+    """
+
+    def __init__(self):
+        self.peak = multiprocessing.Value('q', 0)
+
+    def note(self):
+        own = peak_rss_bytes()
+        if own:
+            with self.peak.get_lock():
+                self.peak.value = max(self.peak.value, own)
+
+# Set in the main process and in its pool workers through their initializer while a pool builds
+current_worker_peak = None
+
+def set_worker_peak_memory(worker_peak):
+    global current_worker_peak
+    current_worker_peak = worker_peak
+
+def note_worker_peak():
+    if current_worker_peak:
+        current_worker_peak.note()
+
+def peak_rss_mb():
+    """Peak resident set size in MB of this process and of its largest pool worker or finished child process, None where unavailable."""
+    own = peak_rss_bytes()
+    if own is None:
+        return None, None
+    children = current_worker_peak.peak.value if current_worker_peak else 0
+    if resource is not None:
+        unit = 1 if sys.platform == 'darwin' else 1024
+        children = max(children, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+    return own / MB, children / MB or None
+
+def report_peak_memory(budget, workers=False):
+    """Print the peak memory of the build, of its pool workers if it used any, and how the memory budget was used."""
+    own, children = peak_rss_mb()
+    if own is not None:
+        message = f"Peak memory: {own:.0f} MB in the main process"
+        if workers and children:
+            message += f", {children:.0f} MB in the largest worker"
+        logging.warning(message)
+        print(message)
+
+    budget_report = budget.report()
+    if budget_report:
+        logging.warning(budget_report)
+        print(budget_report)
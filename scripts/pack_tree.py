@@ -0,0 +1,166 @@
+import os
+import io
+import sys
+import shutil
+import collections
+from PIL import Image
+from image_index import image_index, read_image_header
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request that clones a file's extents on copy-on-write Linux filesystems such as btrfs and XFS
+FICLONE = 0x40049409
+
+def clone_file(source_path, dest_path):
+    """Reflink dest_path to source_path, raises OSError where the filesystem doesn't support it."""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError("Reflinks are not supported on this platform")
+    with open(source_path, 'rb') as source, open(dest_path, 'wb') as dest:
+        fcntl.ioctl(dest.fileno(), FICLONE, source.fileno())
+
+def link_or_copy(source_path, dest_path):
+    """Place source_path at dest_path without reading it if possible: reflink, then hardlink, then a plain copy."""
+    for link in (clone_file, os.link):
+        try:
+            link(source_path, dest_path)
+            return
+        except OSError:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+    shutil.copyfile(source_path, dest_path)
+
+def image_format_for_path(path):
+    """Return the Pillow format name for a file extension, e.g. PNG for .png."""
+    ext = os.path.splitext(path)[1].lower()
+    return Image.registered_extensions().get(ext, 'PNG')
+
+def encode_image(img, relative_path, encoder=None, reduce_colors=True, **save_args):
+    """Encode an image for a pack file, PNGs without explicit save options go through the tree's PngEncoder.
+
+    Returns the encoded bytes and the bytes color reduction saved.
+    """
+    image_format = save_args.pop('format', image_format_for_path(relative_path))
+    if image_format == 'PNG' and encoder and not save_args:
+        return encoder.encode(img, reduce_colors)
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **save_args)
+    return buffer.getvalue(), 0
+
+class EncodingTree:
+    """Image encoding shared by the pack trees, subclasses provide write."""
+
+    def __init__(self, encoder=None):
+        self.encoder = encoder
+        # PNGs encoded into the tree and how many of them color reduction made smaller, by how much
+        self.encode_stats = collections.Counter()
+
+    def save_image(self, relative_path, img, reduce_colors=True, **save_args):
+        """Encode and write an image, returns the bytes color reduction saved on it."""
+        data, saved = encode_image(img, relative_path, self.encoder, reduce_colors, **save_args)
+        self.write(relative_path, data)
+        self.note_encoded(saved)
+        return saved
+
+    def note_encoded(self, saved=0):
+        """Count an encoded image in encode_stats, also for images written from a cache of encoded output."""
+        self.encode_stats['encoded'] += 1
+        if saved:
+            self.encode_stats['reduced'] += 1
+            self.encode_stats['saved_bytes'] += saved
+
+class DirectoryTree(EncodingTree):
+    """Pack files stored as a folder on disk, paths are relative to the root and use forward slashes."""
+
+    def __init__(self, root, encoder=None):
+        super().__init__(encoder)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, relative_path):
+        return os.path.join(self.root, relative_path.replace('/', os.sep))
+
+    def exists(self, relative_path):
+        return bool(relative_path) and os.path.isfile(self.path(relative_path))
+
+    def read(self, relative_path):
+        with open(self.path(relative_path), 'rb') as file:
+            return file.read()
+
+    def _prepare(self, relative_path):
+        """Create the folder for a file and unlink any old file, so writing never changes a hardlinked source."""
+        file_path = self.path(relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if os.path.lexists(file_path):
+            os.remove(file_path)
+        return file_path
+
+    def write(self, relative_path, data):
+        with open(self._prepare(relative_path), 'wb') as file:
+            file.write(data)
+
+    def link_file(self, relative_path, source_path):
+        link_or_copy(source_path, self._prepare(relative_path))
+
+    def open_image(self, relative_path):
+        return Image.open(self.path(relative_path))
+
+    def image_info(self, relative_path):
+        return image_index.get(self.path(relative_path))
+
+    def files(self):
+        for root, dirs, files in os.walk(self.root):
+            for file in files:
+                yield os.path.relpath(os.path.join(root, file), self.root).replace(os.sep, '/')
+
+class LinkedFile(str):
+    """Path of an unmodified file a MemoryTree entry refers to, its bytes are only read when the entry is."""
+
+class MemoryTree(EncodingTree):
+    """Pack files held in memory as encoded bytes, used to stream builds into a zip without temp folders.
+
+    Passthrough files are kept as LinkedFile references to their source instead of being read into memory.
+    """
+
+    def __init__(self, encoder=None):
+        super().__init__(encoder)
+        self.entries = {}
+        self.image_infos = {}
+
+    def exists(self, relative_path):
+        return relative_path in self.entries
+
+    def read(self, relative_path):
+        data = self.entries[relative_path]
+        if isinstance(data, LinkedFile):
+            with open(data, 'rb') as file:
+                return file.read()
+        return data
+
+    def write(self, relative_path, data):
+        self.entries[relative_path] = data
+        self.image_infos.pop(relative_path, None)
+
+    def link_file(self, relative_path, source_path):
+        self.write(relative_path, LinkedFile(source_path))
+
+    def open_image(self, relative_path):
+        data = self.entries[relative_path]
+        if isinstance(data, LinkedFile):
+            return Image.open(data)
+        return Image.open(io.BytesIO(data))
+
+    def image_info(self, relative_path):
+        if relative_path not in self.image_infos:
+            data = self.entries[relative_path]
+            if isinstance(data, LinkedFile):
+                # Linked sources don't change during a build, stat'ed once per tree
+                self.image_infos[relative_path] = image_index.get(data)
+            else:
+                self.image_infos[relative_path] = read_image_header(io.BytesIO(data), relative_path)
+        return self.image_infos[relative_path]
+
+    def files(self):
+        return list(self.entries)
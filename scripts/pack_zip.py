@@ -0,0 +1,272 @@
+import os
+import json
+import zlib
+import struct
+import logging
+import zipfile
+import tempfile
+import collections
+import concurrent.futures
+from datetime import datetime
+from atomic_file import atomic_write
+from build_manifest import hash_bytes
+
+# Entries already compressed by their format are stored, everything else is deflated
+DEFAULT_ZIP_OPTIONS = {
+    'stored_extensions': ['.png', '.tga'],
+    'deflate_level': 9,
+    'threads': 4,
+    'reuse_entries': True,
+    'entry_cache_mb': 256,
+    'update': True,
+}
+
+# Entries smaller than this are compressed on the writing thread, handing them to the pool costs more than it saves
+PARALLEL_MIN_BYTES = 64 * 1024
+
+def get_zip_options(build_config):
+    """Read the zip output options from the build config."""
+    return {
+        'stored_extensions': [ext.lower() for ext in build_config.get('zip_stored_extensions', DEFAULT_ZIP_OPTIONS['stored_extensions'])],
+        'deflate_level': build_config.get('zip_deflate_level', DEFAULT_ZIP_OPTIONS['deflate_level']),
+        'threads': build_config.get('zip_threads', DEFAULT_ZIP_OPTIONS['threads']),
+        'reuse_entries': build_config.get('zip_reuse_entries', DEFAULT_ZIP_OPTIONS['reuse_entries']),
+        'entry_cache_mb': build_config.get('zip_entry_cache_mb', DEFAULT_ZIP_OPTIONS['entry_cache_mb']),
+        'update': build_config.get('zip_update', DEFAULT_ZIP_OPTIONS['update']),
+    }
+
+def compression_for_path(relative_path, zip_options):
+    """Return the (compress_type, level) the policy picks for an entry by its extension."""
+    if os.path.splitext(relative_path)[1].lower() in zip_options['stored_extensions']:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, zip_options['deflate_level']
+
+def compress_entry(data, compress_type, level=None):
+    """Compress the bytes of one entry the way zipfile would, returns (compressed, crc). zlib releases the GIL."""
+    crc = zlib.crc32(data)
+    if compress_type == zipfile.ZIP_STORED:
+        return data, crc
+    compressor = zlib.compressobj(zipfile.ZIP_DEFLATED if level is None else level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(), crc
+
+# Undocumented ZipFile and ZipInfo internals write_compressed_entry appends raw entries with
+ZIPFILE_INTERNALS = ('_lock', '_writecheck', '_didModify', 'start_dir', 'fp', 'filelist', 'NameToInfo')
+ZIPINFO_INTERNALS = ('FileHeader',)
+
+def supports_raw_writes(zipf):
+    """Check the zipfile internals raw entry writes rely on are there, they differ between Python versions."""
+    return all(hasattr(zipf, name) for name in ZIPFILE_INTERNALS) and all(hasattr(zipfile.ZipInfo, name) for name in ZIPINFO_INTERNALS)
+
+def write_compressed_entry(zipf, zinfo, compressed, crc, file_size, level=None):
+    """Append an entry whose data is already compressed with zinfo.compress_type to an archive open for writing.
+
+    Without the zipfile internals this relies on, the data is decompressed and written with writestr instead.
+    """
+    if not supports_raw_writes(zipf):
+        data = compressed
+        if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            data = zlib.decompressobj(-15).decompress(compressed)
+        zipf.writestr(zinfo, data, compress_type=zinfo.compress_type, compresslevel=level)
+        return
+
+    zinfo.file_size = file_size
+    zinfo.compress_size = len(compressed)
+    zinfo.CRC = crc
+    zinfo.flag_bits = 0
+    if not zinfo.external_attr:
+        zinfo.external_attr = 0o600 << 16  # permissions: ?rw-------
+    zip64 = file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+
+    with zipf._lock:
+        zipf._writecheck(zinfo)
+        zipf._didModify = True
+        zipf.fp.seek(zipf.start_dir)
+        zinfo.header_offset = zipf.fp.tell()
+        zipf.fp.write(zinfo.FileHeader(zip64))
+        zipf.fp.write(compressed)
+        zipf.start_dir = zipf.fp.tell()
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[zinfo.filename] = zinfo
+
+def read_raw_entry(zipf, zinfo):
+    """Return the compressed data of an entry of an archive open for reading, without decompressing it."""
+    zipf.fp.seek(zinfo.header_offset)
+    header = zipf.fp.read(zipfile.sizeFileHeader)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local file header for {zinfo.filename}")
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    zipf.fp.seek(zinfo.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+    return zipf.fp.read(zinfo.compress_size)
+
+def current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def load_entry_index(zip_path, entry_index_path):
+    """Return the entry digests recorded for an existing archive, or {} if either is missing."""
+    if not entry_index_path or not os.path.exists(zip_path):
+        return {}
+    try:
+        with open(entry_index_path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_entry_index(entry_index_path, entry_index):
+    try:
+        atomic_write(entry_index_path, json.dumps(entry_index).encode('utf-8'))
+    except OSError as e:
+        logging.warning(f"Warning: Could not save zip entry index {entry_index_path}: {e}")
+
+class RawEntryCache:
+    """Compressed zip entries of finished archives by content digest, bounded by the memory their data takes.
+
+    An archive that needs the same bytes again, at any path, copies the compressed data and CRC verbatim instead of
+    compressing them again. Stored entries aren't kept, copying them saves nothing over writing them.
+    """
+
+    def __init__(self, max_size_mb=256):
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, digest, compress_type, level):
+        return (digest, compress_type, level)
+
+    def fetch(self, key):
+        """Return the (compressed, crc) of an entry, or None if it isn't cached."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def store(self, key, entry):
+        if key in self.entries or len(entry[0]) > self.max_size:
+            return
+        self.entries[key] = entry
+        self.size += len(entry[0])
+        while self.size > self.max_size:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+# One entry cache per process, shared by every archive built in it
+raw_entry_caches = {}
+
+def get_raw_entry_cache(max_size_mb):
+    if max_size_mb not in raw_entry_caches:
+        raw_entry_caches[max_size_mb] = RawEntryCache(max_size_mb)
+    return raw_entry_caches[max_size_mb]
+
+def create_zip_from_tree(tree, zip_path, zip_options=None, entry_index_path=None, update=False):
+    """Create a zip file from a pack tree with the per extension compression policy of zip_options.
+
+    Large entries are compressed on a thread pool while entries are written to the archive one at a time, in the
+    order of the tree. With reuse_entries, compressed entries are copied from earlier archives of the process
+    whenever their content matches.
+
+    The digest of every entry is recorded at entry_index_path. With update, entries whose digest, size, CRC and
+    compression match the ones recorded for the existing archive are copied across from it compressed when they
+    are deflated, only changed and added entries are compressed. The archive is written next to zip_path and swapped in atomically.
+    """
+    zip_options = zip_options or DEFAULT_ZIP_OPTIONS
+    threads = max(1, zip_options['threads'])
+    entry_cache = get_raw_entry_cache(zip_options['entry_cache_mb']) if zip_options['reuse_entries'] else None
+    previous_index = load_entry_index(zip_path, entry_index_path) if update else {}
+    entry_index = {}
+    date_time = datetime.now().timetuple()[:6]
+    # Entries waiting to be written, in archive order, at most a few per thread so compressed data doesn't pile up
+    pending = collections.deque()
+    reused = kept = 0
+
+    def write_pending(keep):
+        while len(pending) > keep:
+            zinfo, file_size, level, result, cache_key = pending.popleft()
+            compressed, crc = result.result() if isinstance(result, concurrent.futures.Future) else result
+            write_compressed_entry(zipf, zinfo, compressed, crc, file_size, level)
+            if cache_key:
+                entry_cache.store(cache_key, (compressed, crc))
+
+    def find_previous_entry(relative_path, data, index_entry):
+        """Return the (compressed, crc) of an unchanged deflated entry of the existing archive, or None.
+
+        Stored entries are written from the fresh bytes, reading them back from the old archive gains nothing.
+        """
+        if previous_zip is None or index_entry[1] == zipfile.ZIP_STORED or previous_index.get(relative_path) != index_entry:
+            return None
+        previous_info = previous_zip.NameToInfo.get(relative_path)
+        if previous_info is None or previous_info.compress_type != index_entry[1] or previous_info.file_size != len(data):
+            return None
+        crc = zlib.crc32(data)
+        if previous_info.CRC != crc:
+            return None
+        return read_raw_entry(previous_zip, previous_info), crc
+
+    output_dir = os.path.dirname(zip_path) or '.'
+    fd, temp_path = tempfile.mkstemp(dir=output_dir, prefix='.', suffix='.zip.tmp')
+    os.close(fd)
+    previous_zip = None
+    try:
+        if previous_index:
+            try:
+                previous_zip = zipfile.ZipFile(zip_path, 'r')
+            except (OSError, zipfile.BadZipFile) as e:
+                logging.warning(f"Warning: Could not update {zip_path}, creating it from scratch: {e}")
+
+        with zipfile.ZipFile(temp_path, 'w') as zipf, concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            for relative_path in tree.files():
+                data = tree.read(relative_path)
+                compress_type, level = compression_for_path(relative_path, zip_options)
+                zinfo = zipfile.ZipInfo(relative_path, date_time)
+                zinfo.compress_type = compress_type
+
+                digest = None
+                if entry_index_path or (entry_cache and compress_type != zipfile.ZIP_STORED):
+                    digest = hash_bytes(data)
+                index_entry = [digest, compress_type, level]
+                if entry_index_path:
+                    entry_index[relative_path] = index_entry
+
+                cache_key = None
+                result = find_previous_entry(relative_path, data, index_entry)
+                if result is not None:
+                    # Unchanged since the existing archive was built, its compressed data is copied across
+                    kept += 1
+                elif entry_cache and compress_type != zipfile.ZIP_STORED:
+                    cache_key = entry_cache.make_key(digest, compress_type, level)
+                    result = entry_cache.fetch(cache_key)
+                    if result is not None:
+                        # Same content as an entry of an earlier archive, its compressed data and CRC are copied as they are
+                        reused += 1
+                        cache_key = None
+
+                if result is None:
+                    if compress_type != zipfile.ZIP_STORED and threads > 1 and len(data) >= PARALLEL_MIN_BYTES:
+                        result = executor.submit(compress_entry, data, compress_type, level)
+                    else:
+                        result = compress_entry(data, compress_type, level)
+                pending.append((zinfo, len(data), level, result, cache_key))
+                write_pending(threads * 4)
+            write_pending(0)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    finally:
+        if previous_zip is not None:
+            previous_zip.close()
+
+    # mkstemp creates the file readable by its owner only, give the zip the permissions a new file would get
+    os.chmod(temp_path, 0o666 & ~current_umask())
+    os.replace(temp_path, zip_path)
+    if entry_index_path:
+        save_entry_index(entry_index_path, entry_index)
+
+    if previous_zip is not None:
+        logging.warning(f"Updated {os.path.basename(zip_path)}: {kept} unchanged deflated entries of {len(entry_index)} copied across")
+    if entry_cache:
+        logging.warning(f"Reused {reused} compressed entries from earlier archives in {os.path.basename(zip_path)}")
@@ -0,0 +1,98 @@
+import io
+import hashlib
+import logging
+import numpy as np
+from PIL import Image
+
+# Pillow PNG save options of each encoder profile, picked with the png_profile build option
+PNG_PROFILES = {
+    # Low zlib effort for quick local iteration
+    'draft': {'compress_level': 1},
+    # Pillow's most thorough settings, maximum zlib compression, for shipped packs
+    'release': {'optimize': True},
+}
+
+def pixel_digest(img):
+    """Hash everything a PNG encode of the image depends on: mode, size, pixels, palette and transparency."""
+    digest = hashlib.sha256()
+    digest.update(f"{img.mode} {img.width}x{img.height} {img.info.get('transparency')!r}".encode('utf-8'))
+    if img.mode == 'P':
+        digest.update(img.palette.tobytes())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+def reduced_images(img):
+    """Lossless versions of an image in smaller PNG color types: grayscale if every pixel is gray, a palette image
+    with a tRNS chunk if it has 256 colors or fewer. Colors are counted with one np.unique over the packed pixels.
+    """
+    if img.mode not in ('RGBA', 'RGB', 'LA', 'L'):
+        return []
+    rgba = np.asarray(img if img.mode == 'RGBA' else img.convert('RGBA'))
+    opaque = bool((rgba[..., 3] == 255).all())
+    candidates = []
+
+    if (rgba[..., 0] == rgba[..., 1]).all() and (rgba[..., 1] == rgba[..., 2]).all():
+        gray_mode = 'L' if opaque else 'LA'
+        if img.mode != gray_mode:
+            gray = rgba[..., 0] if opaque else rgba[..., [0, 3]]
+            candidates.append(Image.fromarray(np.ascontiguousarray(gray), gray_mode))
+
+    colors, indices = np.unique(np.ascontiguousarray(rgba).view(np.uint32).ravel(), return_inverse=True)
+    if len(colors) <= 256:
+        palette = colors.view(np.uint8).reshape(-1, 4)
+        paletted = Image.fromarray(indices.reshape(rgba.shape[:2]).astype(np.uint8), 'P')
+        paletted.putpalette(palette[:, :3].tobytes())
+        if not opaque:
+            paletted.info['transparency'] = palette[:, 3].tobytes()
+        candidates.append(paletted)
+    return candidates
+
+class PngEncoder:
+    """Encodes images to PNG bytes with an encoder profile, cached by pixel digest and profile.
+
+    The cache is a TextureCache, so an image whose pixels were encoded with the same profile before, in another
+    version, resolution or run, is never encoded again. With reduce_colors, images are also encoded as lossless
+    grayscale or palette PNGs and the smallest encoding is kept.
+    """
+
+    def __init__(self, profile='release', cache=None, reduce_colors=True):
+        if profile not in PNG_PROFILES:
+            raise ValueError(f"Unknown PNG profile '{profile}'")
+        self.profile = profile
+        self.cache = cache
+        self.reduce_colors = reduce_colors
+
+    def _encode(self, img):
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', **PNG_PROFILES[self.profile])
+        return buffer.getvalue()
+
+    def encode(self, img, reduce_colors=True):
+        """Encode an image, returns the PNG bytes and how many bytes color reduction saved on them.
+
+        The savings are stored with the cache entry, so encodes answered from the cache report them too.
+        """
+        reduce_colors = self.reduce_colors and reduce_colors
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(pixel_digest(img), {'png_profile': self.profile, 'reduce_colors': reduce_colors})
+            data = self.cache.fetch(cache_key)
+            if data is not None:
+                return data, self.cache.fetch_info(cache_key).get('saved_bytes', 0) if reduce_colors else 0
+
+        data = self._encode(img)
+        saved = 0
+        if reduce_colors:
+            for candidate in reduced_images(img):
+                candidate_data = self._encode(candidate)
+                if len(candidate_data) < len(data):
+                    saved += len(data) - len(candidate_data)
+                    data = candidate_data
+
+        if cache_key:
+            self.cache.store(cache_key, data, {'saved_bytes': saved} if saved else None)
+        return data, saved
+
+    def log_stats(self, label):
+        if self.cache:
+            logging.warning(f"Encoded PNG cache for {label}: {self.cache.hits} hits, {self.cache.misses} encodes")
@@ -0,0 +1,288 @@
+import math
+import numpy as np
+import cv2
+
+# Pillow's fixed point precision for 8 bit resampling, see precompute_coeffs in Pillow's Resample.c
+PRECISION_BITS = 32 - 8 - 2
+
+def lanczos(x):
+    x = np.abs(x)
+    return np.where(x < 3.0, np.sinc(x) * np.sinc(x / 3.0), 0.0)
+
+def resample_weights(in_size, out_size, kernel=lanczos, support=3.0, out_start=0, out_stop=None):
+    """Build the out_size x in_size weight matrix Pillow uses to resample one axis, rounded to its fixed point precision.
+
+    With out_start and out_stop only the rows of those destination pixels are built.
+    """
+    out_stop = out_size if out_stop is None else out_stop
+    scale = in_size / out_size
+    filterscale = max(scale, 1.0)
+    support = support * filterscale
+
+    weights = np.zeros((out_stop - out_start, in_size), np.float64)
+    for out_index in range(out_start, out_stop):
+        center = (out_index + 0.5) * scale
+        in_min = max(int(center - support + 0.5), 0)
+        in_max = min(int(center + support + 0.5), in_size)
+        taps = kernel((np.arange(in_min, in_max) - center + 0.5) / filterscale)
+        total = taps.sum()
+        if total != 0:
+            taps = taps / total
+        weights[out_index - out_start, in_min:in_max] = taps
+
+    # Match Pillow's integer coefficients so results agree with Image.resize
+    return np.round(weights * (1 << PRECISION_BITS)) / (1 << PRECISION_BITS)
+
+def nearest_indices(in_size, out_size):
+    """Source index Pillow's NEAREST filter picks for every destination pixel."""
+    scale = in_size / out_size
+    return np.minimum(((np.arange(out_size) + 0.5) * scale).astype(np.int64), in_size - 1)
+
+def round_to_uint8(values):
+    return np.clip(np.floor(values + 0.5), 0, 255).astype(np.uint8)
+
+def resize_lanczos_batch(stack, out_size):
+    """LANCZOS resize a N x H x W x C uint8 stack to out_size (width, height) with one matrix product per axis.
+
+    Like Pillow the horizontal pass runs first and is rounded to 8 bits before the vertical pass, which keeps the
+    output identical to Image.resize.
+    """
+    n, in_height, in_width, channels = stack.shape
+    out_width, out_height = out_size
+    result = stack
+
+    if out_width != in_width:
+        weights_x = resample_weights(in_width, out_width)
+        result = round_to_uint8(np.einsum('xw,nhwc->nhxc', weights_x, result.astype(np.float64), optimize=True))
+    if out_height != in_height:
+        weights_y = resample_weights(in_height, out_height)
+        result = round_to_uint8(np.einsum('yh,nhwc->nywc', weights_y, result.astype(np.float64), optimize=True))
+
+    return result
+
+def resample_window(in_size, out_size, out_start, out_stop):
+    """Weights of destination pixels out_start to out_stop, trimmed to the source range they read. Returns
+    (weights, in_start, in_stop).
+    """
+    weights = resample_weights(in_size, out_size, out_start=out_start, out_stop=out_stop)
+    used = np.flatnonzero(weights.any(axis=0))
+    in_start, in_stop = (used[0], used[-1] + 1) if len(used) else (0, 0)
+    return weights[:, in_start:in_stop], in_start, in_stop
+
+def resize_lanczos_tiled(image, out_size, tile_size=256):
+    """LANCZOS resize one H x W x C uint8 image to out_size (width, height), tile_size destination pixels square at a time.
+
+    Only the float64 temporaries of one tile are alive at once. The weights are multiples of Pillow's fixed point
+    step and the pixels 8 bit integers, so every sum is exact in float64 and the output is identical to
+    resize_lanczos_batch.
+    """
+    in_height, in_width, channels = image.shape
+    out_width, out_height = out_size
+    result = image
+
+    if out_width != in_width:
+        horizontal = np.empty((in_height, out_width, channels), np.uint8)
+        for x0 in range(0, out_width, tile_size):
+            x1 = min(x0 + tile_size, out_width)
+            weights_x, in_start, in_stop = resample_window(in_width, out_width, x0, x1)
+            for y0 in range(0, in_height, tile_size):
+                tile = result[y0:y0 + tile_size, in_start:in_stop].astype(np.float64)
+                horizontal[y0:y0 + tile_size, x0:x1] = round_to_uint8(np.einsum('xw,hwc->hxc', weights_x, tile, optimize=True))
+        result = horizontal
+
+    if out_height != in_height:
+        vertical = np.empty((out_height, out_width, channels), np.uint8)
+        for y0 in range(0, out_height, tile_size):
+            y1 = min(y0 + tile_size, out_height)
+            weights_y, in_start, in_stop = resample_window(in_height, out_height, y0, y1)
+            for x0 in range(0, out_width, tile_size):
+                tile = result[in_start:in_stop, x0:x0 + tile_size].astype(np.float64)
+                vertical[y0:y1, x0:x0 + tile_size] = round_to_uint8(np.einsum('yh,hwc->ywc', weights_y, tile, optimize=True))
+        result = vertical
+
+    return result
+
+def resize_nearest_batch(stack, out_size):
+    """NEAREST resize a N x H x W (x C) stack to out_size (width, height) by index selection."""
+    out_width, out_height = out_size
+    rows = nearest_indices(stack.shape[1], out_height)
+    columns = nearest_indices(stack.shape[2], out_width)
+    return stack[:, rows][:, :, columns]
+
+# Keeps the RGB bytes of a pixel viewed as uint32, whatever the byte order of the platform
+RGB_MASK = np.array([255, 255, 255, 0], np.uint8).view(np.uint32)[0]
+
+def bleed_alpha_nearest_batch(stack, bleed_distance, background_color=(0, 0, 0)):
+    """Nearest color alpha bleed for a N x H x W x 4 stack, returns the bled copy and leaves the stack untouched.
+
+    The textures are laid out in one tall mosaic with more than bleed_distance transparent rows between them, so a
+    single distance transform labels every pixel without any texture reaching into its neighbours.
+    """
+    n, height, width = stack.shape[:3]
+    gap = int(math.ceil(bleed_distance)) + 1
+    mosaic = np.zeros((n, height + gap, width, 4), np.uint8)
+    mosaic[:, :height] = stack
+    mosaic = mosaic.reshape(n * (height + gap), width, 4)
+
+    transparent = mosaic[..., 3] == 0
+    # View every RGBA pixel as one uint32 so colors are copied with a single gather
+    packed = mosaic.view(np.uint32)[..., 0]
+    packed[transparent] = np.array([*background_color, 0], np.uint8).view(np.uint32)[0]
+
+    if not transparent.all():
+        # Every opaque pixel gets its own label in raster order, each pixel is labeled with its nearest opaque pixel
+        distance, labels = cv2.distanceTransformWithLabels(transparent.view(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_5, labelType=cv2.DIST_LABEL_PIXEL)
+        within_reach = transparent & (distance <= bleed_distance)
+        opaque_pixels = np.flatnonzero(~transparent)
+        packed[within_reach] = packed.ravel()[opaque_pixels[labels[within_reach] - 1]] & RGB_MASK
+
+    return mosaic.reshape(n, height + gap, width, 4)[:, :height]
+
+def scale_textures_batch(stack, scale_factor, bleed_distance):
+    """Batched equivalent of scale_texture_with_separate_channels for a N x H x W x C stack of RGB or RGBA textures."""
+    height, width, channels = stack.shape[1:]
+    out_size = (int(width * scale_factor), int(height * scale_factor))
+
+    if channels == 4:
+        stack = bleed_alpha_nearest_batch(stack, bleed_distance)
+        if out_size == (width, height):
+            return stack
+        result = np.empty((stack.shape[0], out_size[1], out_size[0], 4), np.uint8)
+        result[..., :3] = resize_lanczos_batch(stack[..., :3], out_size)
+        result[..., 3] = resize_nearest_batch(stack[..., 3], out_size)
+        return result
+
+    if out_size == (width, height):
+        return stack
+    return resize_lanczos_batch(stack, out_size)
+
+def scale_texture_tiled(texture, scale_factor, bleed_distance, tile_size=256):
+    """scale_textures_batch for a single H x W x C texture too large to batch, resampled tile by tile.
+
+    The bleed still works on the whole texture, the resample passes hold one tile of float64 temporaries at a time.
+    The output is identical to scale_textures_batch.
+    """
+    height, width, channels = texture.shape
+    out_size = (int(width * scale_factor), int(height * scale_factor))
+
+    if channels == 4:
+        texture = bleed_alpha_nearest_batch(texture[np.newaxis], bleed_distance)[0]
+        if out_size == (width, height):
+            return texture
+        result = np.empty((out_size[1], out_size[0], 4), np.uint8)
+        result[..., :3] = resize_lanczos_tiled(texture[..., :3], out_size, tile_size)
+        result[..., 3] = resize_nearest_batch(texture[np.newaxis, ..., 3], out_size)[0]
+        return result
+
+    if out_size == (width, height):
+        return texture
+    return resize_lanczos_tiled(texture, out_size, tile_size)
+
+def resize_lanczos_float(stack, out_size):
+    """LANCZOS resize a N x H x W x C float stack to out_size (width, height) without rounding between the passes."""
+    n, in_height, in_width, channels = stack.shape
+    out_width, out_height = out_size
+    result = stack
+    if out_width != in_width:
+        result = np.einsum('xw,nhwc->nhxc', resample_weights(in_width, out_width).astype(stack.dtype), result, optimize=True)
+    if out_height != in_height:
+        result = np.einsum('yh,nhwc->nywc', resample_weights(in_height, out_height).astype(stack.dtype), result, optimize=True)
+    return result
+
+def scale_textures_premultiplied(stack, scale_factor, alpha_mode='CUTOUT'):
+    """Downsample a N x H x W x 4 RGBA stack with premultiplied alpha, one LANCZOS resize over all four channels.
+
+    Transparent pixels carry no weight in the premultiplied colors, so no alpha bleed is needed. The colors are
+    divided by the filtered alpha again afterwards. With SMOOTH the filtered alpha is kept. With CUTOUT the alpha is
+    the nearest source pixel's, made binary at half opacity, and opaque pixels the filter gave no coverage keep their
+    nearest source color.
+    """
+    height, width = stack.shape[1:3]
+    out_size = (int(width * scale_factor), int(height * scale_factor))
+    if out_size == (width, height):
+        return stack
+
+    # float32 keeps well over 8 bits of precision through both passes at half the memory traffic of float64
+    premultiplied = stack.astype(np.float32)
+    premultiplied[..., :3] *= premultiplied[..., 3:4] / np.float32(255)
+    resized = resize_lanczos_float(premultiplied, out_size)
+    filtered_alpha = resized[..., 3:4]
+
+    covered = filtered_alpha > 0.5
+    colors = np.where(covered, resized[..., :3] * 255.0 / np.where(covered, filtered_alpha, 1.0), 0.0)
+
+    result = np.empty((stack.shape[0], out_size[1], out_size[0], 4), np.uint8)
+    if alpha_mode == 'SMOOTH':
+        result[..., 3] = round_to_uint8(filtered_alpha[..., 0])
+    else:
+        nearest = resize_nearest_batch(stack, out_size)
+        result[..., 3] = np.where(nearest[..., 3] >= 128, 255, 0)
+        colors = np.where(covered | (result[..., 3:4] == 0), colors, nearest[..., :3])
+    result[..., :3] = round_to_uint8(colors)
+    return result
+
+def box_factor(width, height, scale_factor):
+    """Integer factor a BOX downsample to scale_factor reduces by, or None if it isn't an exact integer reduction of both axes."""
+    factor = round(1 / scale_factor)
+    if factor < 1 or abs(factor * scale_factor - 1) > 1e-9 or width % factor or height % factor:
+        return None
+    if (int(width * scale_factor), int(height * scale_factor)) != (width // factor, height // factor):
+        return None
+    return factor
+
+def resize_box_batch(stack, factor):
+    """Mean of every factor x factor block of a N x H x W (x C) stack as float32.
+
+    The blocks are reshaped onto their own axes and their factor * factor pixels summed one slice at a time, which
+    is several times faster than a mean over the two strided block axes.
+    """
+    n, height, width = stack.shape[:3]
+    blocks = stack.reshape(n, height // factor, factor, width // factor, factor, *stack.shape[3:])
+    total = np.zeros((n, height // factor, width // factor, *stack.shape[3:]), np.float32)
+    for row in range(factor):
+        for column in range(factor):
+            total += blocks[:, :, row, :, column]
+    return total / (factor * factor)
+
+def resize_alpha_nearest(alpha, out_size, cutout=False):
+    """NEAREST resize of a N x H x W alpha stack, made binary at half opacity for cutouts."""
+    alpha = resize_nearest_batch(alpha, out_size)
+    return np.where(alpha >= 128, 255, 0).astype(np.uint8) if cutout else alpha
+
+def scale_textures_box(stack, scale_factor, alpha_mode='SEPARATE'):
+    """Downsample a N x H x W x C RGB or RGBA stack by an exact integer factor, see box_factor, averaging each block.
+
+    Colors are averaged weighted by alpha, so transparent pixels don't darken edges and no alpha bleed is needed.
+    With SMOOTH the alpha is the block average, otherwise it's the nearest source pixel's, binary for CUTOUT.
+    """
+    height, width, channels = stack.shape[1:]
+    factor = box_factor(width, height, scale_factor)
+    if factor == 1:
+        return stack
+    if channels != 4:
+        return round_to_uint8(resize_box_batch(stack, factor))
+
+    alpha = stack[..., 3:4].astype(np.float32)
+    alpha_mean = resize_box_batch(alpha, factor)
+    covered = alpha_mean > 0
+    colors = resize_box_batch(stack[..., :3] * alpha, factor) / np.where(covered, alpha_mean, 1)
+    if not covered.all():
+        # Fully transparent blocks keep the plain average of their colors
+        colors = np.where(covered, colors, resize_box_batch(stack[..., :3], factor))
+
+    result = np.empty(colors.shape[:3] + (4,), np.uint8)
+    result[..., :3] = round_to_uint8(colors)
+    if alpha_mode == 'SMOOTH':
+        result[..., 3] = round_to_uint8(alpha_mean[..., 0])
+    else:
+        result[..., 3] = resize_alpha_nearest(stack[..., 3], (width // factor, height // factor), alpha_mode == 'CUTOUT')
+    return result
+
+def scale_textures_nearest(stack, scale_factor, alpha_mode='SEPARATE'):
+    """NEAREST downsample of a N x H x W x C RGB or RGBA stack, alpha made binary for CUTOUT."""
+    height, width, channels = stack.shape[1:]
+    out_size = (int(width * scale_factor), int(height * scale_factor))
+    result = resize_nearest_batch(stack, out_size)
+    if channels == 4 and alpha_mode == 'CUTOUT':
+        result[..., 3] = resize_alpha_nearest(stack[..., 3], out_size, cutout=True)
+    return result
@@ -0,0 +1,53 @@
+import json
+import logging
+from build_manifest import hash_file
+
+class ContentDedup:
+    """Source textures with identical bytes and identical processing settings, produced once per build stage.
+
+    Sources are identified by the hashes the build computed for its source tree, so every file is hashed once per
+    build. The first source of a content is processed as usual, duplicates at other paths are skipped and get a copy
+    of its output once the stage has produced it.
+    """
+
+    def __init__(self, source_hashes=None):
+        self.source_hashes = source_hashes or {}
+        # Hashes of sources missing from source_hashes, kept apart so the build's hashes aren't modified
+        self.hashed = {}
+        # (scale factor, source hash, settings) -> path of the first source with that content
+        self.first_paths = {}
+        # (level, duplicate path, first path) of every output to copy
+        self.duplicates = []
+
+    def source_hash(self, original_path, full_source_path):
+        """Hash of a source file, from the source tree hashes, hashed now only if the file isn't in them."""
+        source_hash = self.source_hashes.get(original_path) or self.hashed.get(original_path)
+        if source_hash is None:
+            source_hash = self.hashed[original_path] = hash_file(full_source_path)
+        return source_hash
+
+    def claim(self, level, original_path, source_hash, settings):
+        """Return False if original_path is the first source of its content and settings for the level and has to be
+        processed. Return True if it was claimed before, a duplicate's output is then copied by emit."""
+        key = (level['scale_factor'], source_hash, json.dumps(settings, sort_keys=True))
+        first_path = self.first_paths.get(key)
+        if first_path is None:
+            self.first_paths[key] = original_path
+            return False
+        if first_path != original_path:
+            self.duplicates.append((level, original_path, first_path))
+        return True
+
+    def emit(self):
+        """Copy the output of every first source to its duplicates, once the stage has produced them."""
+        for level, original_path, first_path in self.duplicates:
+            level['tree'].write(original_path, level['tree'].read(first_path))
+
+    def report(self, label):
+        if not self.duplicates:
+            return
+        duplicate_paths = {original_path for _, original_path, _ in self.duplicates}
+        message = (f"Content dedup for {label}: {len(duplicate_paths)} duplicate source textures collapsed, "
+                   f"{len(self.duplicates)} outputs copied instead of processed")
+        logging.warning(message)
+        print(message)
@@ -0,0 +1,154 @@
+import os
+import re
+
+RESOLUTION_OVERRIDE_PATTERN = re.compile(r'^(.*)_(\d+)px(\.[^./]+)$')
+
+# Windows paths match regardless of case, like os.path.exists does there
+CASE_INSENSITIVE = os.path.normcase('A') == 'a'
+
+def path_key(relative_path):
+    relative_path = relative_path.replace('\\', '/')
+    return relative_path.lower() if CASE_INSENSITIVE else relative_path
+
+def join_relative(relative_dir, name):
+    return f"{relative_dir}/{name}" if relative_dir else name
+
+class SourceIndex:
+    """Every file in a source tree, listed with one os.scandir walk so existence checks, resolution override
+    lookups and fallback checks are answered from memory.
+
+    Paths are relative to the root and use forward slashes. The mtime of every folder is recorded with its listing,
+    refresh() lists a folder again only once its mtime changed, which happens when files are added, removed or
+    renamed in it. File stats are remembered until forget_stats(), editing a file doesn't change its folder.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.dirs = {}
+        self.files = {}
+        self.overrides = {}
+        self.fallbacks = {}
+        # (mtime_ns, size) of files stat'ed since the last forget_stats()
+        self.stats = {}
+        self.listings = 0
+        self._list('')
+        self._build_lookups()
+
+    def path(self, relative_path):
+        return os.path.join(self.root, relative_path.replace('/', os.sep))
+
+    def exists(self, relative_path):
+        return bool(relative_path) and path_key(relative_path) in self.files
+
+    def paths(self):
+        """List the relative path of every file in the tree."""
+        return list(self.files.values())
+
+    def stat(self, relative_path):
+        """Return the (mtime_ns, size) of a file, stat'ed once until forget_stats() is called, None if it doesn't exist."""
+        key = path_key(relative_path)
+        if key not in self.stats:
+            try:
+                stat = os.stat(self.path(relative_path))
+                self.stats[key] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                return None
+        return self.stats[key]
+
+    def forget_stats(self):
+        """Drop the remembered file stats, files may have been edited in place since. Called once per build."""
+        self.stats = {}
+
+    def find_override(self, relative_path, target_height):
+        """Return the relative path of the _<target_height>px override of a file, or None if there is none."""
+        return self.overrides.get(path_key(relative_path), {}).get(target_height)
+
+    def fallback_exists(self, fallback):
+        """Check a fallback file, those live outside the source tree and are only checked once."""
+        if not fallback:
+            return False
+        if fallback not in self.fallbacks:
+            self.fallbacks[fallback] = os.path.exists(fallback)
+        return self.fallbacks[fallback]
+
+    def add(self, relative_path):
+        """Record a file the builder placed in the source tree itself."""
+        relative_path = relative_path.replace('\\', '/')
+        self.files[path_key(relative_path)] = relative_path
+        self._add_override(relative_path)
+
+    def refresh(self):
+        """List the folders whose mtime changed again, returns True if any did."""
+        changed = False
+        for relative_dir, (mtime_ns, file_names, subdirs) in list(self.dirs.items()):
+            try:
+                current_mtime_ns = os.stat(self.path(relative_dir)).st_mtime_ns
+            except FileNotFoundError:
+                current_mtime_ns = None
+            if current_mtime_ns != mtime_ns:
+                changed = True
+                del self.dirs[relative_dir]
+                if current_mtime_ns is not None:
+                    self._list(relative_dir)
+
+        if changed:
+            self._prune()
+            self._build_lookups()
+        return changed
+
+    def _list(self, relative_dir):
+        """List a folder and every folder below it that wasn't listed yet."""
+        dir_path = self.path(relative_dir)
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            with os.scandir(dir_path) as entries:
+                names = [(entry.name, entry.is_dir()) for entry in entries]
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        self.listings += 1
+
+        file_names = [name for name, is_dir in names if not is_dir]
+        subdirs = [join_relative(relative_dir, name) for name, is_dir in names if is_dir]
+        self.dirs[relative_dir] = (mtime_ns, file_names, subdirs)
+        for subdir in subdirs:
+            if subdir not in self.dirs:
+                self._list(subdir)
+
+    def _prune(self):
+        """Drop folders that are no longer reachable from the root."""
+        reachable = set()
+        pending = ['']
+        while pending:
+            relative_dir = pending.pop()
+            if relative_dir in reachable or relative_dir not in self.dirs:
+                continue
+            reachable.add(relative_dir)
+            pending.extend(self.dirs[relative_dir][2])
+        self.dirs = {relative_dir: listing for relative_dir, listing in self.dirs.items() if relative_dir in reachable}
+
+    def _build_lookups(self):
+        self.files = {}
+        self.overrides = {}
+        for relative_dir, (mtime_ns, file_names, subdirs) in self.dirs.items():
+            for name in file_names:
+                relative_path = join_relative(relative_dir, name)
+                self.files[path_key(relative_path)] = relative_path
+                self._add_override(relative_path)
+
+    def _add_override(self, relative_path):
+        override_match = RESOLUTION_OVERRIDE_PATTERN.match(relative_path)
+        if override_match:
+            base_path = override_match.group(1) + override_match.group(3)
+            self.overrides.setdefault(path_key(base_path), {})[int(override_match.group(2))] = relative_path
+
+# One index per source folder within a process, shared by every target built in it
+source_indexes = {}
+
+def get_source_index(source_dir):
+    """Return the process wide index of a source folder, refreshed if the tree changed since it was listed."""
+    key = os.path.abspath(source_dir)
+    if key in source_indexes:
+        source_indexes[key].refresh()
+    else:
+        source_indexes[key] = SourceIndex(source_dir)
+    return source_indexes[key]
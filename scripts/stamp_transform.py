@@ -0,0 +1,80 @@
+import functools
+import numpy as np
+from PIL import Image
+
+# Every lossless transpose as the matrix it applies to (x, y) pixel offsets, with y pointing down
+TRANSPOSE_MATRICES = {
+    Image.Transpose.FLIP_LEFT_RIGHT: ((-1, 0), (0, 1)),
+    Image.Transpose.FLIP_TOP_BOTTOM: ((1, 0), (0, -1)),
+    Image.Transpose.ROTATE_90: ((0, 1), (-1, 0)),
+    Image.Transpose.ROTATE_180: ((-1, 0), (0, -1)),
+    Image.Transpose.ROTATE_270: ((0, -1), (1, 0)),
+    Image.Transpose.TRANSPOSE: ((0, 1), (1, 0)),
+    Image.Transpose.TRANSVERSE: ((0, -1), (-1, 0)),
+}
+TRANSPOSES_BY_MATRIX = {matrix: method for method, matrix in TRANSPOSE_MATRICES.items()}
+IDENTITY = ((1, 0), (0, 1))
+
+FLIP_MATRICES = {
+    "Horizontal": TRANSPOSE_MATRICES[Image.Transpose.FLIP_LEFT_RIGHT],
+    "Vertical": TRANSPOSE_MATRICES[Image.Transpose.FLIP_TOP_BOTTOM],
+}
+
+def rotation_matrix(angle):
+    """Matrix of a clockwise rotation by a multiple of 90 degrees, the direction stamp mappings rotate in."""
+    if angle % 90:
+        raise ValueError(f"Stamp rotation must be a multiple of 90 degrees, got {angle}")
+    matrix = np.identity(2, int)
+    for _ in range((angle // 90) % 4):
+        matrix = np.array(TRANSPOSE_MATRICES[Image.Transpose.ROTATE_270]) @ matrix
+    return matrix
+
+def to_transpose(matrix):
+    """Return the Image.Transpose method for a matrix, or None for the identity."""
+    matrix = tuple(tuple(int(value) for value in row) for row in matrix)
+    if matrix == IDENTITY:
+        return None
+    return TRANSPOSES_BY_MATRIX[matrix]
+
+@functools.lru_cache(maxsize=None)
+def compile_stamp_transform(rotate=0, flip=None):
+    """Compile a stamp's rotate and flip into the single lossless transpose that applies both.
+
+    The rotation is applied first, then the flip, like the mappings describe them. Returns an Image.Transpose
+    method, or None if the stamp isn't transformed.
+    """
+    matrix = rotation_matrix(rotate)
+    if flip in FLIP_MATRICES:
+        matrix = np.array(FLIP_MATRICES[flip]) @ matrix
+    return to_transpose(matrix)
+
+@functools.lru_cache(maxsize=None)
+def compile_inverse_stamp_transform(rotate=0, flip=None):
+    """Compile the transpose that undoes a stamp's rotate and flip, used to cut stamps back out of an atlas."""
+    transpose = compile_stamp_transform(rotate, flip)
+    if transpose is None:
+        return None
+    # Transpose matrices are orthogonal, so the inverse is the transposed matrix
+    return to_transpose(np.array(TRANSPOSE_MATRICES[transpose]).T)
+
+def stamp_transform(mapping, inverse=False):
+    """Return the precompiled transpose for a stamp mapping entry."""
+    compile_transform = compile_inverse_stamp_transform if inverse else compile_stamp_transform
+    return compile_transform(mapping.get('rotate', 0), mapping.get('flip'))
+
+def apply_transpose(img, transpose):
+    return img if transpose is None else img.transpose(transpose)
+
+# The same transposes as NumPy views of a H x W (x C) array, they never copy pixels
+ARRAY_TRANSPOSES = {
+    Image.Transpose.FLIP_LEFT_RIGHT: lambda array: array[:, ::-1],
+    Image.Transpose.FLIP_TOP_BOTTOM: lambda array: array[::-1],
+    Image.Transpose.ROTATE_90: lambda array: np.rot90(array, 1),
+    Image.Transpose.ROTATE_180: lambda array: array[::-1, ::-1],
+    Image.Transpose.ROTATE_270: lambda array: np.rot90(array, -1),
+    Image.Transpose.TRANSPOSE: lambda array: array.swapaxes(0, 1),
+    Image.Transpose.TRANSVERSE: lambda array: array[::-1, ::-1].swapaxes(0, 1),
+}
+
+def apply_transpose_array(array, transpose):
+    return array if transpose is None else ARRAY_TRANSPOSES[transpose](array)
@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+import logging
+import PIL
+from atomic_file import atomic_write
+
+# Part of every cache key, bump it whenever a change to the builder changes the bytes produced for the same source
+# and settings: resampling, alpha bleed, pyramid, PNG encoding or color reduction. Entries of older versions are
+# then never read again and age out through eviction.
+CACHE_VERSION = 1
+
+class TextureCache:
+    """On-disk cache of processed textures, addressed by source content and processing settings.
+
+    Entries live in two level sharded folders as `<key[:2]>/<key>.png`. The modification time of an entry
+    is bumped on every hit so eviction can drop the least recently used entries first. An entry can carry a small
+    info dict, stored next to it as `<key>.json`.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=2048):
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, source_hash, settings):
+        """Build the cache key for a source hash and the settings used to process it, under the current CACHE_VERSION."""
+        key_data = json.dumps({'source': source_hash, 'version': CACHE_VERSION, 'pillow': PIL.__version__, **settings}, sort_keys=True)
+        return hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key, extension='.png'):
+        return os.path.join(self.cache_dir, key[:2], f"{key}{extension}")
+
+    def fetch(self, key):
+        """Return the cached bytes for a key, or None if the key is not cached."""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as entry:
+                data = entry.read()
+            os.utime(entry_path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data
+
+    def fetch_info(self, key):
+        """Return the info dict stored with an entry, or {} if it has none."""
+        info_path = self._entry_path(key, '.json')
+        try:
+            with open(info_path, 'r') as file:
+                info = json.load(file)
+            os.utime(info_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        return info
+
+    def store(self, key, data, info=None):
+        """Add processed file bytes, and optionally an info dict, to the cache. Writes are atomic so concurrent
+        builds can share a cache, the info is written first so an entry is never found without it."""
+        if info:
+            self._write(self._entry_path(key, '.json'), json.dumps(info).encode('utf-8'), key)
+        self._write(self._entry_path(key), data, key)
+
+    def _write(self, entry_path, data, key):
+        try:
+            atomic_write(entry_path, data)
+        except OSError as e:
+            logging.warning(f"Warning: Could not store {key} in texture cache: {e}")
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits within its size limit."""
+        entries = []
+        total_size = 0
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        removed = 0
+        for mtime, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            total_size -= size
+            removed += 1
+
+        if removed:
+            logging.info(f"Evicted {removed} entries from texture cache, {total_size // (1024 * 1024)} MB remaining")
+        return removed
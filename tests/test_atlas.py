@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from atlas import AtlasHandler
+from build import resolution_adjustments, apply_mappings
+from pack_tree import MemoryTree
+from png_encoder import PngEncoder
+from source_index import get_source_index
+
+def encoded_tree(images):
+    tree = MemoryTree()
+    for relative_path, img in images.items():
+        tree.save_image(relative_path, img)
+    return tree
+
+def gradient(mode, size=(16, 16)):
+    """A source with distinct pixels, so crops and transposes can't hide behind symmetric content."""
+    width, height = size
+    array = np.zeros((height, width, 4), np.uint8)
+    array[..., 0] = np.arange(width)[None, :] * 16
+    array[..., 1] = np.arange(height)[:, None] * 16
+    array[..., 2] = 128
+    array[..., 3] = 255
+    array[::3, ::5, 3] = 64
+    return Image.fromarray(array, 'RGBA').convert(mode)
+
+SOURCES = {
+    'rgba.png': gradient('RGBA'),
+    'rgb.png': gradient('RGB'),
+    'gray.png': gradient('L'),
+    'palette.png': gradient('RGBA').quantize(64),
+}
+
+UID_MAPPINGS = {path.split('.')[0]: {'path': path, 'resolution': [16, 16]} for path in SOURCES}
+
+STAMPS = [
+    {'uid': 'rgba', 'copy': [0, 0, 16, 16], 'position': [0, 0]},
+    # Crops past the right and bottom edges of the source
+    {'uid': 'rgb', 'copy': [8, 8, 24, 24], 'position': [16, 0], 'rotate': 90},
+    {'uid': 'gray', 'copy': [-4, 0, 12, 16], 'position': [32, 0], 'flip': "Horizontal"},
+    {'uid': 'palette', 'copy': [4, 4, 20, 12], 'position': [0, 16], 'rotate': 270, 'flip': "Vertical"},
+    {'uid': 'rgba', 'copy': [12, 0, 28, 8], 'position': [24, 20]},
+]
+
+@pytest.mark.parametrize('atlas_type', ['stamp', 'tga'])
+def test_numpy_backend_matches_pillow(atlas_type):
+    source_tree = encoded_tree(SOURCES)
+    atlases = {}
+    for backend in ('pillow', 'numpy'):
+        output_tree = MemoryTree()
+        atlas = AtlasHandler(backend=backend).compile_atlas(source_tree, STAMPS, output_tree, 'atlas.png', atlas_type, UID_MAPPINGS, canvas_size=(48, 32))
+        atlases[backend] = np.asarray(atlas)
+    assert atlases['numpy'].shape == (32, 48, 4)
+    np.testing.assert_array_equal(atlases['numpy'], atlases['pillow'])
+
+@pytest.mark.parametrize('backend', ['pillow', 'numpy'])
+def test_out_of_bounds_stamp_crop_stays_transparent(tmp_path, backend):
+    # An opaque gray source, color reduction would store its downsampled copy as a grayscale PNG
+    Image.new('RGBA', (16, 16), (90, 90, 90, 255)).save(tmp_path / 'stone.png')
+    uid_mappings = {'stone': {'path': 'stone.png', 'resolution': [16, 16]}}
+    mappings = [{'type': 'stamp', 'destination': 'atlas.png', 'canvas_size': [32, 16],
+                 'source': [{'uid': 'stone', 'copy': [8, 0, 24, 16], 'position': [0, 0]}]}]
+
+    resolution_tree = MemoryTree(PngEncoder('draft'))
+    levels = [{'scale_factor': 0.5, 'tree': resolution_tree, 'variables': {}}]
+    resolution_adjustments(get_source_index(str(tmp_path)), levels, mappings, uid_mappings, texture_options={'png_profile': 'draft', 'reduce_colors': True})
+    dest_tree = MemoryTree(PngEncoder('draft'))
+    apply_mappings(resolution_tree, dest_tree, mappings, uid_mappings, label='test', atlas_backend=backend)
+
+    with dest_tree.open_image('atlas.png') as atlas:
+        atlas = np.asarray(atlas.convert('RGBA'))
+    assert (atlas[:, :4] == (90, 90, 90, 255)).all()
+    assert (atlas[:, 4:, 3] == 0).all()
@@ -0,0 +1,21 @@
+import os
+from unittest import mock
+
+import pytest
+
+from atomic_file import atomic_write
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = tmp_path / 'cache' / 'entry.json'
+    atomic_write(str(path), b'old')
+    atomic_write(str(path), b'new')
+    assert path.read_bytes() == b'new'
+    assert os.listdir(tmp_path / 'cache') == ['entry.json']
+
+def test_failed_write_removes_temp_file(tmp_path):
+    path = tmp_path / 'entry.json'
+    path.write_bytes(b'old')
+    with mock.patch('os.replace', side_effect=PermissionError("locked")), pytest.raises(OSError):
+        atomic_write(str(path), b'new')
+    assert path.read_bytes() == b'old'
+    assert os.listdir(tmp_path) == ['entry.json']
@@ -0,0 +1,28 @@
+import os
+import pytest
+
+from build_manifest import BuildManifest, hash_file, hash_source_tree
+from source_index import get_source_index
+
+def test_dangling_symlink_is_skipped(tmp_path):
+    source_dir = tmp_path / 'source'
+    source_dir.mkdir()
+    (source_dir / 'pack.mcmeta').write_bytes(b'{}')
+    try:
+        os.symlink(source_dir / 'missing.png', source_dir / 'dangling.png')
+    except (OSError, NotImplementedError):
+        pytest.skip("Symlinks are not available")
+
+    source_hashes, _ = hash_source_tree(get_source_index(str(source_dir)), str(tmp_path / 'cache' / 'hashes.json'))
+    assert source_hashes == {'pack.mcmeta': hash_file(source_dir / 'pack.mcmeta')}
+
+def test_resolution_overrides_come_from_the_index(tmp_path):
+    source_dir = tmp_path / 'source'
+    (source_dir / 'textures').mkdir(parents=True)
+    for name in ('stone.png', 'stone_32px.png', 'stone_16px.png', 'dirt.png'):
+        (source_dir / 'textures' / name).write_bytes(name.encode('utf-8'))
+
+    source_hashes, resolution_overrides = hash_source_tree(get_source_index(str(source_dir)), str(tmp_path / 'cache' / 'hashes.json'))
+    manifest = BuildManifest()
+    manifest.add_source_texture('textures/stone.png', source_hashes, resolution_overrides)
+    assert set(manifest.inputs) == {'source:textures/stone.png', 'source:textures/stone_16px.png', 'source:textures/stone_32px.png'}
@@ -0,0 +1,55 @@
+import os
+import sys
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+import pack_zip
+from pack_tree import MemoryTree
+
+ENTRIES = {
+    'pack.mcmeta': b'{"pack": {"pack_format": 15}}' * 10,
+    'assets/minecraft/textures/block/stone.png': b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4,
+    'assets/minecraft/models/block/large.json': b'{"parent": "block/cube_all"}\n' * 4000,
+}
+
+ZIP_OPTIONS = {**pack_zip.DEFAULT_ZIP_OPTIONS, 'reuse_entries': False}
+
+class CreateZipFromTreeTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(self.temp_dir.name, 'pack.zip')
+        self.tree = MemoryTree()
+        for relative_path, data in ENTRIES.items():
+            self.tree.write(relative_path, data)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def assert_archive_matches(self):
+        with zipfile.ZipFile(self.zip_path) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(sorted(archive.namelist()), sorted(ENTRIES))
+            for relative_path, data in ENTRIES.items():
+                self.assertEqual(archive.read(relative_path), data)
+                expected_type, _ = pack_zip.compression_for_path(relative_path, ZIP_OPTIONS)
+                self.assertEqual(archive.getinfo(relative_path).compress_type, expected_type)
+
+    def test_raw_writes(self):
+        pack_zip.create_zip_from_tree(self.tree, self.zip_path, ZIP_OPTIONS)
+        self.assert_archive_matches()
+
+    def test_writestr_fallback_without_zipfile_internals(self):
+        with mock.patch.object(pack_zip, 'supports_raw_writes', return_value=False):
+            pack_zip.create_zip_from_tree(self.tree, self.zip_path, ZIP_OPTIONS)
+        self.assert_archive_matches()
+
+    def test_zipfile_internals_present(self):
+        with zipfile.ZipFile(os.path.join(self.temp_dir.name, 'probe.zip'), 'w') as archive:
+            self.assertTrue(pack_zip.supports_raw_writes(archive))
+
+if __name__ == '__main__':
+    unittest.main()
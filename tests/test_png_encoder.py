@@ -0,0 +1,46 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from png_encoder import PngEncoder, reduced_images
+
+def decode(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return np.asarray(img.convert('RGBA'))
+
+def sample(kind):
+    rng = np.random.default_rng(3)
+    pixels = np.zeros((16, 16, 4), np.uint8)
+    if kind == 'gray':
+        pixels[..., :3] = rng.integers(0, 256, (16, 16, 1), dtype=np.uint8)
+        pixels[..., 3] = 255
+    elif kind == 'gray alpha':
+        pixels[..., :3] = rng.integers(0, 256, (16, 16, 1), dtype=np.uint8)
+        pixels[..., 3] = rng.integers(0, 256, (16, 16), dtype=np.uint8)
+    elif kind == 'palette':
+        colors = rng.integers(0, 256, (40, 4), dtype=np.uint8)
+        colors[:10, 3] = 0
+        pixels[:] = colors[rng.integers(0, 40, (16, 16))]
+    else:
+        # Far more colors than a palette holds
+        pixels = rng.integers(0, 256, (32, 32, 4), dtype=np.uint8)
+    return Image.fromarray(pixels, 'RGBA')
+
+@pytest.mark.parametrize('kind', ['gray', 'gray alpha', 'palette', 'full color'])
+def test_reduced_images_decode_to_the_same_pixels(kind):
+    img = sample(kind)
+    candidates = reduced_images(img)
+    assert bool(candidates) == (kind != 'full color')
+    for candidate in candidates:
+        buffer = io.BytesIO()
+        candidate.save(buffer, format='PNG')
+        np.testing.assert_array_equal(decode(buffer.getvalue()), np.asarray(img))
+
+@pytest.mark.parametrize('kind', ['gray', 'palette'])
+def test_encoder_output_is_lossless(kind):
+    img = sample(kind)
+    data, saved = PngEncoder('draft').encode(img)
+    assert saved > 0
+    np.testing.assert_array_equal(decode(data), np.asarray(img))
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from build import bleed_alpha_nearest, get_bleed_distance, scale_texture_stack, scale_texture_with_separate_channels
+from resample import scale_texture_tiled, scale_textures_batch
+
+def texture(seed, mode, size=(32, 32)):
+    """Noise with transparent holes, so the alpha bleed and the separate alpha resample both matter."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    pixels = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    pixels[..., 3] = np.where(rng.random((height, width)) < 0.4, 0, 255)
+    pixels[:, :width // 4, 3] = 0
+    return Image.fromarray(pixels, 'RGBA').convert(mode)
+
+@pytest.mark.parametrize('mode', ['RGBA', 'RGB'])
+@pytest.mark.parametrize('scale_factor', [0.5, 0.25, 0.125])
+def test_stack_matches_pillow(mode, scale_factor):
+    images = [texture(seed, mode) for seed in range(3)]
+    resized = scale_texture_stack(np.stack([np.asarray(img) for img in images]), scale_factor)
+    for img, stacked in zip(images, resized):
+        np.testing.assert_array_equal(stacked, np.asarray(scale_texture_with_separate_channels(img, scale_factor)))
+
+def test_nearest_bleed_fills_transparent_pixels():
+    pixels = np.zeros((8, 8, 4), np.uint8)
+    pixels[2, 3] = (200, 100, 50, 255)
+    bled = np.asarray(bleed_alpha_nearest(Image.fromarray(pixels, 'RGBA'), 2))
+    within_reach = np.hypot(*np.mgrid[-2:6, -3:5]) <= 2
+    assert (bled[within_reach][:, :3] == (200, 100, 50)).all()
+    assert (bled[~within_reach][:, :3] == 0).all()
+    np.testing.assert_array_equal(bled[..., 3], pixels[..., 3])
+
+@pytest.mark.parametrize('mode', ['RGBA', 'RGB'])
+@pytest.mark.parametrize('scale_factor', [0.5, 0.25])
+def test_tiled_matches_batch(mode, scale_factor):
+    # Tiles smaller than the texture and not dividing it, so tile edges and the last partial tile are covered
+    texture_array = np.asarray(texture(7, mode, size=(80, 56)))
+    bleed_distance = get_bleed_distance(scale_factor)
+    batched = scale_textures_batch(texture_array[None], scale_factor, bleed_distance)[0]
+    np.testing.assert_array_equal(scale_texture_tiled(texture_array, scale_factor, bleed_distance, tile_size=24), batched)
@@ -0,0 +1,43 @@
+import itertools
+
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from stamp_transform import stamp_transform, apply_transpose, apply_transpose_array
+
+ROTATIONS = [0, 90, 180, 270, -90]
+FLIPS = [None, "Horizontal", "Vertical"]
+MAPPINGS = [{'rotate': rotate, 'flip': flip} for rotate, flip in itertools.product(ROTATIONS, FLIPS)]
+
+def stamp(size):
+    width, height = size
+    return Image.fromarray(np.arange(width * height * 4, dtype=np.uint32).astype(np.uint8).reshape(height, width, 4), 'RGBA')
+
+def rotate_and_flip(img, mapping):
+    """The rotate then flip the stamp mappings describe, done the way compile_atlas did before transposes.
+    Pillow's rotate is lossless for quarter turns of a square image."""
+    rotated_img = img.rotate(-mapping['rotate'])
+    if mapping['flip'] == "Horizontal":
+        rotated_img = ImageOps.mirror(rotated_img)
+    if mapping['flip'] == "Vertical":
+        rotated_img = ImageOps.flip(rotated_img)
+    return rotated_img
+
+@pytest.mark.parametrize('mapping', MAPPINGS)
+def test_transpose_matches_rotate_and_flip(mapping):
+    img = stamp((8, 8))
+    np.testing.assert_array_equal(np.asarray(apply_transpose(img, stamp_transform(mapping))), np.asarray(rotate_and_flip(img, mapping)))
+
+@pytest.mark.parametrize('mapping', MAPPINGS)
+def test_inverse_round_trip(mapping):
+    img = stamp((12, 5))
+    transformed = apply_transpose(img, stamp_transform(mapping))
+    restored = apply_transpose(transformed, stamp_transform(mapping, inverse=True))
+    np.testing.assert_array_equal(np.asarray(restored), np.asarray(img))
+
+@pytest.mark.parametrize('mapping', MAPPINGS)
+def test_array_views_match_pillow(mapping):
+    img = stamp((12, 5))
+    transpose = stamp_transform(mapping)
+    np.testing.assert_array_equal(apply_transpose_array(np.asarray(img), transpose), np.asarray(apply_transpose(img, transpose)))